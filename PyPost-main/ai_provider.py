@@ -2,88 +2,214 @@
 AI Provider Module
 Handles initialization and configuration of different AI providers.
 """
+import asyncio
+import functools
 import os
+import threading
+import weakref
 import streamlit as st
-from openai import OpenAI
-import google.generativeai as genai
-import anthropic
+from config import AI_CONFIG
+
+# Provider SDKs are imported inside _build_client so only the selected one is loaded.
+
+_dotenv_loaded = False
+
+@functools.lru_cache(maxsize=None)
+def _resolve_api_key(provider_name):
+    """Look up a provider API key in the environment, parsing .env at most once per process."""
+    global _dotenv_loaded
+    env_var = f"{provider_name.upper()}_API_KEY"
+    api_key = os.getenv(env_var)
+    
+    # If still no key, check for a .env file
+    if not api_key and not _dotenv_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _dotenv_loaded = True
+        api_key = os.getenv(env_var)
+    
+    return api_key
 
 def get_ai_provider(provider_name=None):
     """
     Get the configured AI provider based on user selection.
     """
-    import os
-    import streamlit as st
-    
     if provider_name is None:
         provider_name = st.session_state.get('selected_ai_provider', 'OpenAI')
     
     # Check session state first, then environment variables
     api_key = st.session_state.get(f"{provider_name.upper()}_API_KEY")
     if not api_key:
-        api_key = os.getenv(f"{provider_name.upper()}_API_KEY")
-    
-    # If still no key, check for a .env file
-    if not api_key:
-        from dotenv import load_dotenv
-        load_dotenv()
-        api_key = os.getenv(f"{provider_name.upper()}_API_KEY")
+        api_key = _resolve_api_key(provider_name)
     
     if not api_key or api_key.startswith('your_'):
         st.warning(f"Please set the {provider_name} API key in the settings.")
         return None
     
+    return _cached_provider(provider_name, api_key)
+
+@st.cache_resource(show_spinner=False)
+def _cached_provider(provider_name, api_key):
+    """Build the AIProvider once per (provider, API key) pair and reuse it across reruns."""
     return AIProvider(provider_name, api_key)
 
+@st.cache_resource(show_spinner=False)
+def _build_client(provider_name, api_key):
+    """Initialize the SDK client for a provider, cached so HTTP pools survive reruns."""
+    if provider_name == 'OpenAI':
+        from openai import OpenAI
+        return OpenAI(api_key=api_key)
+    elif provider_name == 'Gemini':
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        return genai
+    elif provider_name == 'Claude':
+        import anthropic
+        return anthropic.Client(api_key=api_key)
+    elif provider_name == 'Grok':
+        # Note: Grok API integration would go here
+        # This is a placeholder as Grok's API details may vary
+        return {"api_key": api_key}
+    else:
+        raise ValueError(f"Unsupported AI provider: {provider_name}")
+
+def _build_async_client(provider_name, api_key):
+    """Initialize an async SDK client; a client is only used on the event loop that created it."""
+    if provider_name == 'OpenAI':
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=api_key)
+    elif provider_name == 'Claude':
+        import anthropic
+        return anthropic.AsyncAnthropic(api_key=api_key)
+    # Gemini exposes async methods on the configured module; Grok is a placeholder
+    return _build_client(provider_name, api_key)
+
 class AIProvider:
     def __init__(self, provider_name, api_key):
         self.provider_name = provider_name
         self.api_key = api_key
-        self.client = self._initialize_client()
+        self.client = _build_client(provider_name, api_key)
+        # Bounds in-flight requests, whether fanned out across threads or coroutines
+        self.max_concurrency = AI_CONFIG.get(provider_name, {}).get('max_concurrency', 4)
+        self._semaphore = threading.Semaphore(self.max_concurrency)
+        # Async clients keyed by event loop, since each asyncio.run uses a fresh loop
+        self._async_clients = weakref.WeakKeyDictionary()
+    
+    def generate_response(self, prompt, **kwargs):
+        """Generate a response using the selected AI provider.
+        
+        Pass json_mode=True to request a bare JSON object from the provider.
+        """
+        with self._semaphore:
+            return self._generate_response(prompt, **kwargs)
     
-    def _initialize_client(self):
-        """Initialize the appropriate client based on the provider."""
+    def _generate_response(self, prompt, **kwargs):
+        """Call the provider SDK; use generate_response to respect the concurrency limit."""
         if self.provider_name == 'OpenAI':
-            return OpenAI(api_key=self.api_key)
+            response = self.client.chat.completions.create(**self._openai_params(prompt, kwargs))
+            return response.choices[0].message.content
+            
         elif self.provider_name == 'Gemini':
-            genai.configure(api_key=self.api_key)
-            return genai
+            model = self.client.GenerativeModel(kwargs.get('model', 'gemini-pro'))
+            response = model.generate_content(prompt, **self._gemini_params(kwargs))
+            return response.text
+            
         elif self.provider_name == 'Claude':
-            return anthropic.Client(api_key=self.api_key)
+            response = self.client.messages.create(**self._claude_params(prompt, kwargs))
+            return self._claude_text(response, kwargs)
+            
         elif self.provider_name == 'Grok':
-            # Note: Grok API integration would go here
-            # This is a placeholder as Grok's API details may vary
-            return {"api_key": self.api_key}
+            # Placeholder for Grok API implementation
+            return f"[Grok response for: {prompt}]"
+            
+        return "Error: Unsupported AI provider"
+    
+    def stream_response(self, prompt, **kwargs):
+        """Yield the response text incrementally as the provider streams it."""
+        if self.provider_name == 'OpenAI':
+            stream = self.client.chat.completions.create(
+                **self._openai_params(prompt, kwargs), stream=True)
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                    
+        elif self.provider_name == 'Gemini':
+            model = self.client.GenerativeModel(kwargs.get('model', 'gemini-pro'))
+            for chunk in model.generate_content(prompt, stream=True, **self._gemini_params(kwargs)):
+                yield chunk.text
+                
+        elif self.provider_name == 'Claude':
+            with self.client.messages.stream(**self._claude_params(prompt, kwargs)) as stream:
+                yield from stream.text_stream
+                
         else:
-            raise ValueError(f"Unsupported AI provider: {self.provider_name}")
+            yield self.generate_response(prompt, **kwargs)
     
-    def generate_response(self, prompt, **kwargs):
-        """Generate a response using the selected AI provider."""
+    async def generate_response_async(self, prompt, **kwargs):
+        """Async counterpart of generate_response using the providers' async clients."""
+        client = self._async_clients.get(asyncio.get_running_loop())
+        if client is None:
+            client = _build_async_client(self.provider_name, self.api_key)
+            self._async_clients[asyncio.get_running_loop()] = client
+        
         if self.provider_name == 'OpenAI':
-            response = self.client.chat.completions.create(
-                model=kwargs.get('model', 'gpt-4'),
-                messages=[{"role": "user", "content": prompt}],
-                temperature=kwargs.get('temperature', 0.7),
-                max_tokens=kwargs.get('max_tokens', 1000)
-            )
+            response = await client.chat.completions.create(**self._openai_params(prompt, kwargs))
             return response.choices[0].message.content
             
         elif self.provider_name == 'Gemini':
-            model = self.client.GenerativeModel(kwargs.get('model', 'gemini-pro'))
-            response = model.generate_content(prompt)
+            model = client.GenerativeModel(kwargs.get('model', 'gemini-pro'))
+            response = await model.generate_content_async(prompt, **self._gemini_params(kwargs))
             return response.text
             
         elif self.provider_name == 'Claude':
-            response = self.client.messages.create(
-                model=kwargs.get('model', 'claude-3-opus-20240229'),
-                max_tokens=kwargs.get('max_tokens', 1000),
-                temperature=kwargs.get('temperature', 0.7),
-                messages=[{"role": "user", "content": prompt}]
-            )
-            return response.content[0].text
+            response = await client.messages.create(**self._claude_params(prompt, kwargs))
+            return self._claude_text(response, kwargs)
             
         elif self.provider_name == 'Grok':
             # Placeholder for Grok API implementation
             return f"[Grok response for: {prompt}]"
             
         return "Error: Unsupported AI provider"
+    
+    async def aclose(self):
+        """Close the async client of the running event loop before the loop shuts down."""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        close = getattr(client, 'close', None)
+        if asyncio.iscoroutinefunction(close):
+            await close()
+    
+    def _openai_params(self, prompt, kwargs):
+        """Build chat completion arguments for OpenAI."""
+        params = {
+            "model": kwargs.get('model', 'gpt-4'),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": kwargs.get('temperature', 0.7),
+            "max_tokens": kwargs.get('max_tokens', 1000)
+        }
+        if kwargs.get('json_mode'):
+            params["response_format"] = {"type": "json_object"}
+        return params
+    
+    def _gemini_params(self, kwargs):
+        """Build generate_content arguments for Gemini."""
+        if kwargs.get('json_mode'):
+            return {"generation_config": {"response_mime_type": "application/json"}}
+        return {}
+    
+    def _claude_params(self, prompt, kwargs):
+        """Build message arguments for Claude."""
+        messages = [{"role": "user", "content": prompt}]
+        if kwargs.get('json_mode'):
+            # Claude has no JSON mode; prefilling the opening brace keeps it to a bare object
+            messages.append({"role": "assistant", "content": "{"})
+        return {
+            "model": kwargs.get('model', 'claude-3-opus-20240229'),
+            "max_tokens": kwargs.get('max_tokens', 1000),
+            "temperature": kwargs.get('temperature', 0.7),
+            "messages": messages
+        }
+    
+    def _claude_text(self, response, kwargs):
+        """Extract the reply text, restoring the prefilled brace in JSON mode."""
+        text = response.content[0].text
+        return "{" + text if kwargs.get('json_mode') else text
@@ -11,38 +11,6 @@ from settings_ui import show_ai_settings, get_ai_settings
 from ai_provider import get_ai_provider
 from config import AI_CONFIG, AI_PROVIDERS, DEFAULT_AI_PROVIDER, TAB_NAMES
 
-# Import UI components
-def import_ui_components():
-    from ui_components import (
-        render_email_list_tab,
-        render_smart_search_tab,
-        render_summaries_tab,
-        render_smart_reply_tab,
-        render_analytics_tab,
-        render_sentiment_tab,
-        render_chatbot_tab
-    )
-    return (
-        render_email_list_tab,
-        render_smart_search_tab,
-        render_summaries_tab,
-        render_smart_reply_tab,
-        render_analytics_tab,
-        render_sentiment_tab,
-        render_chatbot_tab
-    )
-
-# Import UI components
-(
-    render_email_list_tab,
-    render_smart_search_tab,
-    render_summaries_tab,
-    render_smart_reply_tab,
-    render_analytics_tab,
-    render_sentiment_tab,
-    render_chatbot_tab
-) = import_ui_components()
-
 # Removed compose modal for simplicity
 
 def render_sidebar():
@@ -91,14 +59,24 @@ def main():
         # Get selected AI provider and settings
         ai_settings = get_ai_settings()
         
-        # Initialize AI provider
-        ai_provider = get_ai_provider(ai_settings["provider"])
+        # Initialize AI provider once per browser session; it and the handles built on it
+        # are keyed on the AI settings and rebuilt whenever any of them changes
+        if st.session_state.get('_handles_settings') != ai_settings:
+            st.session_state.pop('ai_provider', None)
+            st.session_state.pop('email_ai', None)
+            st.session_state.pop('rag_chatbot', None)
+            st.session_state['_handles_settings'] = ai_settings
+        if st.session_state.get('ai_provider') is None:
+            st.session_state['ai_provider'] = get_ai_provider(ai_settings.provider)
+        ai_provider = st.session_state['ai_provider']
         if not ai_provider:
             st.error("Please select an AI provider in settings")
             return
         
-        # Initialize Gmail manager
-        gmail_manager = GmailManager()
+        # Gmail credentials belong to the user, so the manager is kept per session
+        if 'gmail_manager' not in st.session_state:
+            st.session_state['gmail_manager'] = GmailManager()
+        gmail_manager = st.session_state['gmail_manager']
         
         # Handle Gmail authentication
         if not st.session_state.gmail_authenticated:
@@ -108,6 +86,7 @@ def main():
                     if success:
                         st.session_state.gmail_authenticated = True
                         st.session_state.gmail_auth_message = "Successfully connected to Gmail"
+                        st.rerun()
                     else:
                         st.session_state.gmail_auth_error = "Failed to connect to Gmail. Please try again."
                         st.session_state.gmail_authenticated = False
@@ -120,45 +99,45 @@ def main():
             return  # Don't proceed until authenticated
         
         # Initialize managers with AI provider
-        email_ai = EmailAI(ai_provider)
-        rag_chatbot = EmailRAGChatbot(ai_provider)
-        
-        # Check authentication state
-        if not st.session_state.gmail_authenticated:
-            if st.button("Connect Gmail", type="primary"):
-                try:
-                    if gmail_manager.authenticate():
-                        st.session_state.gmail_authenticated = True
-                        st.success("Successfully connected to Gmail")
-                        st.rerun()
-                    else:
-                        st.error("Failed to authenticate with Gmail")
-                except Exception as e:
-                    st.error(f"Error during Gmail authentication: {str(e)}")
-            return
+        # EmailAI wraps this session's provider, so like the chatbot it is kept per session
+        if getattr(st.session_state.get('email_ai'), 'ai_provider', None) is not ai_provider:
+            st.session_state['email_ai'] = EmailAI(ai_provider)
+        email_ai = st.session_state['email_ai']
+        # The chatbot holds this user's indexed emails, so it is also kept per session
+        if getattr(st.session_state.get('rag_chatbot'), 'account_key', None) != gmail_manager.account_key:
+            st.session_state['rag_chatbot'] = EmailRAGChatbot(ai_provider, gmail_manager.account_key)
+        rag_chatbot = st.session_state['rag_chatbot']
         
-        # Main interface with tabs
+        # Main interface with tabs; ui_components and its heavy dependencies are
+        # only imported once the user is authenticated
         tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs(TAB_NAMES)
         
         with tab1:
+            from ui_components import render_email_list_tab
             render_email_list_tab(gmail_manager, email_ai)
         
         with tab2:
+            from ui_components import render_smart_search_tab
             render_smart_search_tab(gmail_manager, email_ai)
         
         with tab3:
+            from ui_components import render_summaries_tab
             render_summaries_tab(email_ai)
         
         with tab4:
+            from ui_components import render_smart_reply_tab
             render_smart_reply_tab(gmail_manager, email_ai)
             
         with tab5:
+            from ui_components import render_analytics_tab
             render_analytics_tab(gmail_manager, email_ai)
             
         with tab6:
+            from ui_components import render_sentiment_tab
             render_sentiment_tab(email_ai)
             
         with tab7:
+            from ui_components import render_chatbot_tab
             render_chatbot_tab(gmail_manager, rag_chatbot)
 
 
@@ -0,0 +1,31 @@
+"""
+Small thread-safe LRU cache for results shared between reruns and sessions
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Mapping guarded by a lock that drops the least recently used entries beyond maxsize"""
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+    
+    def get(self, key, default=None):
+        """Return the value stored for key, marking it as recently used"""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries over the bound"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -6,6 +6,12 @@ Configuration and constants for the Gmail AI Assistant
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly',
           'https://www.googleapis.com/auth/gmail.send']
 
+# Maximum number of calls Gmail accepts in one batch request
+GMAIL_BATCH_SIZE = 100
+
+# Parallel requests used when messages have to be fetched one by one
+GMAIL_FETCH_WORKERS = 10
+
 # Search examples for the smart search feature
 SEARCH_EXAMPLES = [
     "jobs related emails",
@@ -41,6 +47,43 @@ EMAIL_CATEGORIES = [
     "Other"
 ]
 
+# Sentence embedding model shared by the RAG chatbot and email categorization
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Optional int8 ONNX export of the embedding model, used instead of PyTorch when present.
+# Create it with: optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2
+#   --task feature-extraction --optimize O3 --quantize int8 ./model-int8
+EMBEDDING_ONNX_DIR = "model-int8"
+
+# Directory where email embeddings are persisted between runs, one file per Gmail account
+EMBEDDING_CACHE_DIR = ".email_emb_cache"
+
+# Embeddings kept per account, least recently used dropped first
+EMBEDDING_STORE_MAX_ENTRIES = 20000
+
+# Minimum cosine similarity for the embedding classifier to skip the AI categorization call
+CATEGORY_MIN_SIMILARITY = 0.35
+
+# Emails classified per AI request when categorizing a batch
+CATEGORIZE_BATCH_SIZE = 15
+
+# Characters of an email body kept from the start and end when building AI prompts
+EMAIL_BODY_HEAD_CHARS = 2000
+EMAIL_BODY_TAIL_CHARS = 1000
+
+# AI responses and parsed messages kept in memory for the whole process, least recently used dropped first
+AI_RESPONSE_CACHE_SIZE = 1000
+MESSAGE_CACHE_SIZE = 2000
+
+# Streamed AI responses kept per session for replay on reruns, least recently used dropped first
+STREAM_CACHE_MAX_ENTRIES = 50
+
+# Emails rendered per page in list views
+EMAILS_PER_PAGE = 10
+
+# Characters of the body shown in email list previews
+EMAIL_PREVIEW_CHARS = 500
+
 # App configuration
 APP_CONFIG = {
     "page_title": "Gmail AI Assistant - ChatGPT Powered",
@@ -66,7 +109,8 @@ AI_CONFIG = {
         ],
         "default_model": "gpt-4o",
         "temperature": 0.7,
-        "max_tokens": 1000
+        "max_tokens": 1000,
+        "max_concurrency": 8
     },
     "Gemini": {
         "api_key_env": "GEMINI_API_KEY",
@@ -78,7 +122,8 @@ AI_CONFIG = {
         ],
         "default_model": "gemini-2.5-flash",
         "temperature": 0.7,
-        "max_tokens": 1000
+        "max_tokens": 1000,
+        "max_concurrency": 8
     },
     "Claude": {
         "api_key_env": "ANTHROPIC_API_KEY",
@@ -89,7 +134,8 @@ AI_CONFIG = {
         ],
         "default_model": "claude-3-sonnet-20240229",
         "temperature": 0.7,
-        "max_tokens": 1000
+        "max_tokens": 1000,
+        "max_concurrency": 4
     },
     "Grok": {
         "api_key_env": "GROK_API_KEY",
@@ -100,7 +146,8 @@ AI_CONFIG = {
         ],
         "default_model": "grok-1.5",
         "temperature": 0.7,
-        "max_tokens": 1000
+        "max_tokens": 1000,
+        "max_concurrency": 4
     }
 }
 
@@ -2,8 +2,236 @@
 Email AI module for handling AI-powered email operations using various AI providers
 """
 
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+import numpy as np
 import streamlit as st
-from config import EMAIL_CATEGORIES, AI_CONFIG
+from config import (EMAIL_CATEGORIES, AI_CONFIG, EMAIL_BODY_HEAD_CHARS, EMAIL_BODY_TAIL_CHARS,
+                    CATEGORIZE_BATCH_SIZE, STREAM_CACHE_MAX_ENTRIES, AI_RESPONSE_CACHE_SIZE,
+                    CATEGORY_MIN_SIMILARITY)
+from cache import LRUCache
+from embeddings import get_embedder
+
+
+def _payload_hash(email_content, *extra):
+    """Hash the email fields (and any extra prompt inputs) that feed a prompt"""
+    digest = hashlib.sha1()
+    for field in ('subject', 'sender', 'date', 'body'):
+        digest.update(str(email_content.get(field, '')).encode('utf-8'))
+        digest.update(b'\0')
+    for value in extra:
+        digest.update(str(value).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _truncate(body, head=EMAIL_BODY_HEAD_CHARS, tail=EMAIL_BODY_TAIL_CHARS):
+    """Keep the start and end of a long email body to bound prompt size"""
+    if len(body) <= head + tail:
+        return body
+    return body[:head] + "\n...[truncated]...\n" + body[-tail:]
+
+
+@st.cache_resource(show_spinner=False)
+def _response_cache():
+    """AI responses keyed by provider, operation, email id and payload hash, reused across reruns"""
+    return LRUCache(AI_RESPONSE_CACHE_SIZE)
+
+
+@st.cache_data(show_spinner=False, ttl=86400)
+def _cached_search_query(provider_key, query, _ai_provider):
+    """Translate a natural language query once per provider and reuse the result"""
+    return _ai_provider.generate_response(_SEARCH_QUERY_TMPL.format(query=query)).strip()
+
+
+@st.cache_resource(show_spinner=False)
+def _category_embeddings():
+    """Embed the category labels once so classification is a single matrix product"""
+    return get_embedder().encode(EMAIL_CATEGORIES, normalize_embeddings=True, convert_to_numpy=True)
+
+
+def _parse_json_object(text):
+    """Parse a JSON object from an AI response, tolerating surrounding prose or code fences"""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        start, end = (text or '').find('{'), (text or '').rfind('}')
+        if start == -1 or end <= start:
+            return {}
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            return {}
+    return data if isinstance(data, dict) else {}
+
+
+# Bullet list of categories used in the categorization prompt
+_CATEGORIES_BLOCK = "\n".join(f"- {cat}" for cat in EMAIL_CATEGORIES)
+
+# Prompt templates. Static instructions come first and the email last, so every
+# request for an operation shares the same prefix (what provider-side prompt caching keys on).
+_EMAIL_BLOCK = """
+Subject: {subject}
+From: {sender}
+Date: {date}
+Content: {body}
+"""
+
+_SUMMARY_TMPL = """Please provide a concise summary of the email below.
+
+Summary should include:
+1. Main topic/purpose
+2. Key points
+3. Action items (if any)
+4. Urgency level (Low/Medium/High)
+
+Please format the summary clearly and concisely.
+
+Email:""" + _EMAIL_BLOCK
+
+_SUMMARY_ACTIONS_TMPL = """Please summarize the email below and list its action items.
+
+Start with a "**Summary:**" section covering:
+1. Main topic/purpose
+2. Key points
+3. Urgency level (Low/Medium/High)
+
+Then add an "**Action Items:**" section. For each action item, provide:
+1. What needs to be done
+2. Who is responsible (if mentioned)
+3. Deadline (if mentioned)
+4. Priority level (High/Medium/Low)
+
+If no action items are found, write "No action items found." in that section.
+
+Email:""" + _EMAIL_BLOCK
+
+_REPLY_TMPL = """Generate a {tone} reply to the email below.
+
+Please write a thoughtful and appropriate response that:
+1. Acknowledges the sender's message
+2. Addresses their main points
+3. Provides a clear response
+4. Maintains a {tone} tone
+5. Is concise but complete
+
+Do not include subject line or sender information in the response, just the email body.
+
+Original Email:""" + _EMAIL_BLOCK
+
+_CATEGORIZE_TMPL = """Categorize the email below into one of these categories:
+""" + _CATEGORIES_BLOCK.replace("{", "{{").replace("}", "}}") + """
+
+Respond with a JSON object:
+{{"category": "<category>", "confidence": <0-100>, "explanation": "<brief explanation>"}}
+
+Email:""" + _EMAIL_BLOCK
+
+_CATEGORIZE_BATCH_TMPL = """Categorize each of the numbered emails below into one of these categories:
+""" + _CATEGORIES_BLOCK.replace("{", "{{").replace("}", "}}") + """
+
+Respond with a JSON object containing one result per email:
+{{"results": [{{"id": <email number>, "category": "<category>", "confidence": <0-100>, "explanation": "<brief explanation>"}}]}}
+
+Emails:
+{emails}
+"""
+
+_BATCH_EMAIL_TMPL = """{n}) Subject: {subject}
+From: {sender}
+Content: {body}
+"""
+
+_ACTIONS_TMPL = """Extract action items from the email below. For each action item, provide:
+1. What needs to be done
+2. Who is responsible (if mentioned)
+3. Deadline (if mentioned)
+4. Priority level (High/Medium/Low)
+
+If no action items are found, respond with "No action items found."
+
+Format each action item clearly with bullet points.
+
+Email:""" + _EMAIL_BLOCK
+
+_SENTIMENT_TMPL = """Analyze the sentiment and tone of the email below.
+
+Provide:
+1. Overall sentiment (Positive/Negative/Neutral)
+2. Tone (Formal/Informal/Friendly/Urgent/etc.)
+3. Confidence level (0-100%)
+4. Key emotional indicators
+
+Format your response clearly.
+
+Email:""" + _EMAIL_BLOCK
+
+_SEARCH_QUERY_TMPL = """Convert a natural language query to a Gmail search query.
+
+Convert it to Gmail's search syntax. Common patterns:
+- Jobs/Career: from:(linkedin.com OR indeed.com OR glassdoor.com) OR subject:(job OR career OR opportunity OR hiring)
+- Meetings: subject:(meeting OR call OR zoom OR teams)
+- Urgent: subject:(urgent OR important OR ASAP)
+- Newsletters: subject:(newsletter OR update OR digest)
+
+Return only the Gmail search query, nothing else.
+
+Natural Query: {query}
+"""
+
+
+def _email_fields(email_content, body_limit=None):
+    """Collect the template fields for an email, trimming the body to the prompt budget"""
+    body = email_content['body']
+    return {
+        'subject': email_content['subject'],
+        'sender': email_content['sender'],
+        'date': email_content.get('date', 'Unknown Date'),
+        'body': body[:body_limit] + "..." if body_limit else _truncate(body),
+    }
+
+
+def _summary_prompt(email_content):
+    """Build the standalone summary prompt"""
+    return _SUMMARY_TMPL.format(**_email_fields(email_content))
+
+
+def _reply_prompt(email_content, reply_tone):
+    """Build the smart reply prompt for the given tone"""
+    return _REPLY_TMPL.format(tone=reply_tone, **_email_fields(email_content))
+
+
+def _op_request(op, email_content):
+    """Return the cache op name, prompt and request options for an operation accepted by EmailAI._run_op"""
+    if op == "summarize":
+        return 'summarize', _summary_prompt(email_content), {}
+    if op == "categorize":
+        prompt = _CATEGORIZE_TMPL.format(**_email_fields(email_content, body_limit=500))
+        return 'categorize', prompt, {'json_mode': True, 'max_tokens': 80}
+    if op == "actions":
+        return 'actions', _ACTIONS_TMPL.format(**_email_fields(email_content)), {}
+    if op == "sentiment":
+        return 'sentiment', _SENTIMENT_TMPL.format(**_email_fields(email_content)), {}
+    raise KeyError(op)
+
+
+def _op_result(op, response):
+    """Turn the raw response of an operation into its result"""
+    if op == "categorize":
+        data = _parse_json_object(response)
+        if data.get('category'):
+            return _format_category(data['category'], data.get('confidence', 'N/A'), data.get('explanation', ''))
+    return response
+
+
+def _format_category(category, confidence, explanation):
+    """Render a categorization in the Category/Confidence/Explanation text format"""
+    return (f"Category: {category}\n"
+            f"Confidence: {confidence}%\n"
+            f"Explanation: {explanation}")
+
 
 class EmailAI:
     """Handles AI-powered email operations using various AI providers"""
@@ -20,129 +248,199 @@ class EmailAI:
             st.error(f"Error generating response: {str(e)}")
             return f"Sorry, I couldn't generate a response at this time. Error: {str(e)}"
     
-    def summarize_email(self, email_content):
-        """Summarize an email"""
-        prompt = f"""
-        Please provide a concise summary of this email:
-        
-        Subject: {email_content['subject']}
-        From: {email_content['sender']}
-        Date: {email_content['date']}
+    def _provider_key(self):
+        """Identify the provider and model so switching either invalidates cached responses"""
+        return f"{self.ai_provider.provider_name}:{st.session_state.get('selected_model', '')}"
+    
+    def _response_key(self, op, email_content, *extra):
+        """Key a response on the provider, operation, email id and the inputs that feed its prompt"""
+        return (self._provider_key(), op, email_content.get('id', ''), _payload_hash(email_content, *extra))
+    
+    def _generate_email_response(self, op, email_content, prompt, *extra, json_mode=False, max_tokens=None):
+        """Generate a response for an email operation, memoized on the email id and operation"""
+        key = self._response_key(op, email_content, *extra)
+        response = _response_cache().get(key)
+        if response is not None:
+            return response
         
-        Content: {email_content['body']}
+        kwargs = {}
+        if json_mode:
+            kwargs['json_mode'] = True
+        if max_tokens:
+            kwargs['max_tokens'] = max_tokens
+        try:
+            response = self.ai_provider.generate_response(prompt, **kwargs)
+        except Exception as e:
+            st.error(f"Error generating response: {str(e)}")
+            return f"Sorry, I couldn't generate a response at this time. Error: {str(e)}"
+        _response_cache().put(key, response)
+        return response
+    
+    def _run_op(self, op, email_content):
+        """Run one of the summarize, categorize, actions or sentiment operations for a single email"""
+        cache_op, prompt, options = _op_request(op, email_content)
+        return _op_result(op, self._generate_email_response(cache_op, email_content, prompt, **options))
+    
+    def _stream_email_response(self, op, email_content, prompt, *extra):
+        """Stream a response for an email operation, replaying the finished text on reruns"""
+        key = self._response_key(op, email_content, *extra)
+        finished = st.session_state.setdefault('_ai_stream_cache', OrderedDict())
+        if key in finished:
+            finished.move_to_end(key)
+            yield finished[key]
+            return
         
-        Summary should include:
-        1. Main topic/purpose
-        2. Key points
-        3. Action items (if any)
-        4. Urgency level (Low/Medium/High)
+        chunks = []
+        try:
+            for chunk in self.ai_provider.stream_response(prompt):
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            st.error(f"Error generating response: {str(e)}")
+            yield f"Sorry, I couldn't generate a response at this time. Error: {str(e)}"
+            return
+        finished[key] = "".join(chunks)
+        while len(finished) > STREAM_CACHE_MAX_ENTRIES:
+            finished.popitem(last=False)
+    
+    def _run_op_many(self, op, emails, concurrency=None):
+        """Run an operation over several emails on one event loop using the async SDK clients.
         
-        Please format the summary clearly and concisely.
+        Only the requests missing from the response cache are sent.
         """
+        cache = _response_cache()
+        requests = [_op_request(op, email) for email in emails]
+        keys = [self._response_key(cache_op, email) for email, (cache_op, _, _) in zip(emails, requests)]
+        responses = [cache.get(key) for key in keys]
+        missing = [i for i, response in enumerate(responses) if response is None]
         
-        return self._generate_response(prompt)
+        if missing:
+            fetched = asyncio.run(self._fetch_async(
+                [requests[i][1:] for i in missing], concurrency or self.ai_provider.max_concurrency))
+            for i, response in zip(missing, fetched):
+                if isinstance(response, Exception):
+                    st.error(f"Error generating response: {str(response)}")
+                    responses[i] = f"Sorry, I couldn't generate a response at this time. Error: {str(response)}"
+                    continue
+                cache.put(keys[i], response)
+                responses[i] = response
+        return [_op_result(op, response) for response in responses]
     
-    def generate_smart_reply(self, email_content, reply_tone="professional"):
-        """Generate a smart reply to an email"""
-        prompt = f"""
-        Generate a {reply_tone} reply to this email:
+    async def _fetch_async(self, requests, concurrency):
+        """Send (prompt, options) requests concurrently, limited by an asyncio semaphore"""
+        semaphore = asyncio.Semaphore(concurrency)
         
-        Original Email:
-        Subject: {email_content['subject']}
-        From: {email_content['sender']}
-        Date: {email_content['date']}
-        Content: {email_content['body']}
+        async def fetch(prompt, options):
+            async with semaphore:
+                try:
+                    return await self.ai_provider.generate_response_async(prompt, **options)
+                except Exception as e:
+                    return e
         
-        Please write a thoughtful and appropriate response that:
-        1. Acknowledges the sender's message
-        2. Addresses their main points
-        3. Provides a clear response
-        4. Maintains a {reply_tone} tone
-        5. Is concise but complete
+        try:
+            return await asyncio.gather(*(fetch(prompt, options) for prompt, options in requests))
+        finally:
+            await self.ai_provider.aclose()
+    
+    def summarize_email(self, email_content):
+        """Summarize an email"""
+        return self._run_op('summarize', email_content)
+    
+    def summarize_email_stream(self, email_content):
+        """Summarize an email, yielding text as it is generated"""
+        return self._stream_email_response('summarize', email_content, _summary_prompt(email_content))
+    
+    def summarize_with_actions_stream(self, email_content):
+        """Summarize an email and list its action items in one response, yielding text as it is generated"""
+        prompt = _SUMMARY_ACTIONS_TMPL.format(**_email_fields(email_content))
+        return self._stream_email_response('summary_actions', email_content, prompt)
+    
+    def generate_smart_reply(self, email_content, reply_tone="professional"):
+        """Generate a smart reply to an email"""
+        return self._generate_email_response(
+            'reply', email_content, _reply_prompt(email_content, reply_tone), reply_tone)
+    
+    def generate_smart_reply_stream(self, email_content, reply_tone="professional"):
+        """Generate a smart reply, yielding text as it is generated"""
+        return self._stream_email_response(
+            'reply', email_content, _reply_prompt(email_content, reply_tone), reply_tone)
+    
+    def classify_via_embeddings(self, email_content):
+        """Pick the closest category by embedding similarity, returning (category, similarity)"""
+        text = f"{email_content['subject']}\n{email_content['body'][:500]}"
+        query = get_embedder().encode([text], normalize_embeddings=True, convert_to_numpy=True)[0]
+        scores = _category_embeddings() @ query
+        best = int(np.argmax(scores))
+        return EMAIL_CATEGORIES[best], float(scores[best])
+    
+    def _categorize_by_embedding(self, email_content):
+        """Return a categorization when the embedding classifier is confident, otherwise None"""
+        try:
+            category, similarity = self.classify_via_embeddings(email_content)
+        except Exception:
+            return None
+        if similarity < CATEGORY_MIN_SIMILARITY:
+            return None
+        return _format_category(category, round(similarity * 100),
+                                "Closest category by embedding similarity")
+    
+    def categorize_emails_batch(self, emails, chunk_size=CATEGORIZE_BATCH_SIZE):
+        """Categorize many emails, classifying up to chunk_size of them per AI request.
         
-        Do not include subject line or sender information in the response, just the email body.
+        Emails the embedding classifier is confident about skip the AI entirely; any the
+        batched response leaves out are categorized individually.
         """
+        results = [self._categorize_by_embedding(email) for email in emails]
+        pending = [i for i, result in enumerate(results) if result is None]
         
-        return self._generate_response(prompt)
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            listing = "\n".join(
+                _BATCH_EMAIL_TMPL.format(n=n, **_email_fields(emails[i], body_limit=300))
+                for n, i in enumerate(chunk, 1))
+            prompt = _CATEGORIZE_BATCH_TMPL.format(emails=listing)
+            batch_key = {'id': ",".join(emails[i].get('id', '') for i in chunk)}
+            response = self._generate_email_response(
+                'categorize_batch', batch_key, prompt, prompt, json_mode=True, max_tokens=80 * len(chunk))
+            
+            items = _parse_json_object(response).get('results', [])
+            for item in items if isinstance(items, list) else []:
+                try:
+                    n = int(item['id'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                if 1 <= n <= len(chunk) and item.get('category'):
+                    results[chunk[n - 1]] = _format_category(item['category'], item.get('confidence', 'N/A'),
+                                                  item.get('explanation', ''))
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            for i, result in zip(missing, self._run_op_many("categorize", [emails[i] for i in missing])):
+                results[i] = result
+        return results
     
     def categorize_email(self, email_content):
         """Categorize an email"""
-        categories_str = "\n".join([f"- {cat}" for cat in EMAIL_CATEGORIES])
-        
-        prompt = f"""
-        Categorize this email into one of these categories:
-        {categories_str}
-        
-        Also provide a confidence score (0-100) for your categorization and a brief explanation.
-        
-        Email Content:
-        Subject: {email_content['subject']}
-        From: {email_content['sender']}
-        Content: {email_content['body'][:500]}...
-        
-        Format your response as: 
-        Category: [category]
-        Confidence: [score]%
-        Explanation: [brief explanation]
-        """
-        
-        return self._generate_response(prompt)
+        # Embedding misses go straight to the short categorize prompt
+        return self._categorize_by_embedding(email_content) or self._run_op('categorize', email_content)
     
     def extract_action_items(self, email_content):
         """Extract action items from an email"""
-        prompt = f"""
-        Extract action items from this email. For each action item, provide:
-        1. What needs to be done
-        2. Who is responsible (if mentioned)
-        3. Deadline (if mentioned)
-        4. Priority level (High/Medium/Low)
-        
-        Email Content:
-        Subject: {email_content['subject']}
-        From: {email_content['sender']}
-        Content: {email_content['body']}
-        
-        If no action items are found, respond with "No action items found."
-        
-        Format each action item clearly with bullet points.
-        """
-        
-        return self._generate_response(prompt)
+        return self._run_op('actions', email_content)
     
     def analyze_sentiment(self, email_content):
         """Analyze the sentiment of an email"""
-        prompt = f"""
-        Analyze the sentiment and tone of this email:
-        
-        Subject: {email_content['subject']}
-        From: {email_content['sender']}
-        Content: {email_content['body']}
-        
-        Provide:
-        1. Overall sentiment (Positive/Negative/Neutral)
-        2. Tone (Formal/Informal/Friendly/Urgent/etc.)
-        3. Confidence level (0-100%)
-        4. Key emotional indicators
-        
-        Format your response clearly.
-        """
-        
-        return self._generate_response(prompt)
+        return self._run_op('sentiment', email_content)
+    
+    def analyze_sentiment_stream(self, email_content):
+        """Analyze the sentiment of an email, yielding text as it is generated"""
+        prompt = _SENTIMENT_TMPL.format(**_email_fields(email_content))
+        return self._stream_email_response('sentiment', email_content, prompt)
     
     def generate_search_query(self, natural_query):
         """Convert natural language query to Gmail search query"""
-        prompt = f"""
-        Convert this natural language query to a Gmail search query:
-        
-        Natural Query: {natural_query}
-        
-        Convert it to Gmail's search syntax. Common patterns:
-        - Jobs/Career: from:(linkedin.com OR indeed.com OR glassdoor.com) OR subject:(job OR career OR opportunity OR hiring)
-        - Meetings: subject:(meeting OR call OR zoom OR teams)
-        - Urgent: subject:(urgent OR important OR ASAP)
-        - Newsletters: subject:(newsletter OR update OR digest)
-        
-        Return only the Gmail search query, nothing else.
-        """
-        
-        return self._generate_response(prompt) 
\ No newline at end of file
+        try:
+            return _cached_search_query(self._provider_key(), natural_query.strip(), self.ai_provider)
+        except Exception as e:
+            st.error(f"Error generating response: {str(e)}")
+            return f"Sorry, I couldn't generate a response at this time. Error: {str(e)}" 
\ No newline at end of file
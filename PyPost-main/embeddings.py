@@ -0,0 +1,124 @@
+"""
+Shared sentence embedding model for the RAG chatbot and email categorization
+"""
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import streamlit as st
+from config import EMBEDDING_MODEL, EMBEDDING_CACHE_DIR, EMBEDDING_STORE_MAX_ENTRIES, EMBEDDING_ONNX_DIR
+
+
+class OnnxEmbedder:
+    """Mean-pooled sentence embeddings from an ONNX export, with SentenceTransformer's encode API"""
+    
+    # Sequence limit the sentence-transformers config uses for MiniLM
+    max_seq_length = 256
+    
+    def __init__(self, model_dir):
+        import onnxruntime
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+    
+    def encode(self, sentences, batch_size=32, normalize_embeddings=False, **kwargs):
+        """Embed a list of sentences into a float32 array"""
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            tokens = self.tokenizer(sentences[start:start + batch_size], padding=True, truncation=True,
+                                    max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: value for name, value in tokens.items() if name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            batches.append((hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None))
+        vectors = np.concatenate(batches).astype(np.float32, copy=False) if batches else np.empty((0, 0), np.float32)
+        if normalize_embeddings and len(vectors):
+            vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors
+
+
+@st.cache_resource(show_spinner=False)
+def get_embedder():
+    """Load the sentence embedding model once per process, preferring the ONNX export"""
+    if os.path.exists(os.path.join(EMBEDDING_ONNX_DIR, "model.onnx")):
+        try:
+            return OnnxEmbedder(EMBEDDING_ONNX_DIR)
+        except ImportError:
+            pass
+    import torch
+    from sentence_transformers import SentenceTransformer
+    # Leave cores for FAISS and the other search worker instead of oversubscribing
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+def _store_tag():
+    """Identify the model and backend that produced stored embeddings"""
+    return f"{EMBEDDING_MODEL}:{type(get_embedder()).__name__}"
+
+
+class EmbeddingStore:
+    """Email embeddings of one account keyed by message id, shared by that account's sessions"""
+    
+    def __init__(self, path, vectors=()):
+        self.path = path
+        self._lock = threading.Lock()
+        self._vectors = OrderedDict()
+        self.update(dict(vectors))
+    
+    def get_many(self, ids):
+        """Return the stored embeddings among ids, marking them as recently used"""
+        with self._lock:
+            found = {i: self._vectors[i] for i in ids if i in self._vectors}
+            for i in found:
+                self._vectors.move_to_end(i)
+            return found
+    
+    def update(self, vectors):
+        """Add embeddings, dropping the least recently used beyond EMBEDDING_STORE_MAX_ENTRIES"""
+        with self._lock:
+            for i, vector in vectors.items():
+                self._vectors[i] = vector
+                self._vectors.move_to_end(i)
+            while len(self._vectors) > EMBEDDING_STORE_MAX_ENTRIES:
+                self._vectors.popitem(last=False)
+    
+    def save(self):
+        """Write the store to disk through a private temporary file, replacing the previous file atomically"""
+        with self._lock:
+            ids = list(self._vectors)
+            vectors = np.stack([self._vectors[i] for i in ids]) if ids else None
+        if not ids:
+            return
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # mkstemp gives each writer its own owner-only file, so concurrent saves cannot interleave
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, model=_store_tag(), ids=np.array(ids), vectors=vectors)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def load_embedding_store(account_key):
+    """Load the email embeddings an account saved in earlier runs"""
+    path = os.path.join(EMBEDDING_CACHE_DIR, f"{account_key or 'default'}.npz")
+    try:
+        # .npz archives cannot be memory-mapped, so the vectors are read eagerly
+        with np.load(path) as data:
+            if str(data['model']) == _store_tag():
+                return EmbeddingStore(path, zip(data['ids'].tolist(), data['vectors']))
+    except (OSError, KeyError, ValueError):
+        pass
+    return EmbeddingStore(path)
@@ -7,18 +7,47 @@ Run this script to fix common SSL/TLS issues
 import subprocess
 import sys
 import os
+import json
+import re
+import shutil
 import ssl
 import socket
+import certifi
 import requests
+from requests.adapters import HTTPAdapter
 
-def run_command(command):
-    """Run a command and return the result"""
+# One SSL context for every probe, so the CA bundle is parsed only once
+_CTX = ssl.create_default_context(cafile=certifi.where())
+
+class _CtxAdapter(HTTPAdapter):
+    """HTTPAdapter that hands the shared SSL context to its connection pools"""
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = _CTX
+        return super().init_poolmanager(*args, **kwargs)
+
+# Shared session so both probes reuse one connection pool
+_SESSION = requests.Session()
+_SESSION.mount("https://", _CtxAdapter())
+
+def run_command(args):
+    """Run a command (given as an argument list, without a shell) and return the result"""
     try:
-        result = subprocess.run(command, shell=True, capture_output=True, text=True)
+        result = subprocess.run(args, shell=False, capture_output=True, text=True)
         return result.returncode == 0, result.stdout, result.stderr
     except Exception as e:
         return False, "", str(e)
 
+def pip_command(*args):
+    """Build a pip command for the running interpreter"""
+    return [sys.executable, "-m", "pip", "--disable-pip-version-check", *args]
+
+def install_command(*args):
+    """Build an upgrade command, preferring uv's much faster resolver when it is installed"""
+    uv = shutil.which("uv")
+    if uv:
+        return [uv, "pip", "install", "--python", sys.executable, "--upgrade", *args]
+    return pip_command("install", "--upgrade", *args)
+
 def check_python_version():
     """Check Python version"""
     print(f"Python version: {sys.version}")
@@ -35,34 +64,75 @@ def check_ssl_version():
     except AttributeError:
         print("SSL version info: Not available")
 
+def normalize_package_name(name):
+    """Normalize a package name as pip does (PEP 503)"""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+def list_packages(*options):
+    """Return normalized names from pip list with the given options, or None on failure"""
+    success, stdout, stderr = run_command(pip_command("list", "--format=json", *options))
+    if not success:
+        return None
+    try:
+        return {normalize_package_name(pkg['name']) for pkg in json.loads(stdout)}
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def read_requirement_names(path='requirements.txt'):
+    """Return normalized package names listed in a requirements file"""
+    names = []
+    with open(path) as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            match = re.match(r'[A-Za-z0-9][A-Za-z0-9._-]*', line)
+            if match and not line.startswith('-'):
+                names.append(normalize_package_name(match.group(0)))
+    return names
+
 def update_packages():
-    """Update Python packages"""
+    """Install missing requirements and update Python packages that are out of date"""
     print("\n🔄 Updating Python packages...")
     
+    outdated = list_packages("--outdated")
+    if outdated is None:
+        print("⚠️  Could not check for outdated packages, upgrading everything")
+    
     # Update pip
-    success, stdout, stderr = run_command(f"{sys.executable} -m pip install --upgrade pip")
-    if success:
-        print("✅ pip updated successfully")
+    if outdated is not None and 'pip' not in outdated:
+        print("✅ pip is up to date")
     else:
-        print(f"❌ Failed to update pip: {stderr}")
-    
-    # Update requirements
-    if os.path.exists('requirements.txt'):
-        success, stdout, stderr = run_command(f"{sys.executable} -m pip install --upgrade -r requirements.txt")
+        success, stdout, stderr = run_command(install_command("pip"))
         if success:
-            print("✅ Requirements updated successfully")
+            print("✅ pip updated successfully")
         else:
-            print(f"❌ Failed to update requirements: {stderr}")
-    else:
+            print(f"❌ Failed to update pip: {stderr}")
+    
+    # Update requirements
+    if not os.path.exists('requirements.txt'):
         print("⚠️  requirements.txt not found")
+        return
+    
+    # The outdated check only decides whether pip can be skipped; the install itself always
+    # goes through requirements.txt so missing packages, extras and version specifiers apply
+    installed = list_packages() if outdated is not None else None
+    if installed is not None and all(name in installed and name not in outdated
+                                     for name in read_requirement_names()):
+        print("✅ Requirements are up to date")
+        return
+    
+    success, stdout, stderr = run_command(install_command("-r", "requirements.txt"))
+    if success:
+        print("✅ Requirements updated successfully")
+    else:
+        print(f"❌ Failed to update requirements: {stderr}")
 
 def test_network_connectivity():
     """Test network connectivity"""
     print("\n🌐 Testing network connectivity...")
     
     try:
-        response = requests.get('https://www.google.com', timeout=10)
-        if response.status_code == 200:
+        response = _SESSION.head('https://www.google.com', timeout=5, allow_redirects=False)
+        if response.status_code in [200, 301, 302]:
             print("✅ Internet connection is working")
             return True
         else:
@@ -77,7 +147,7 @@ def test_gmail_api():
     print("\n📧 Testing Gmail API access...")
     
     try:
-        response = requests.get('https://gmail.googleapis.com/gmail/v1/users/me/profile', timeout=10)
+        response = _SESSION.head('https://gmail.googleapis.com/gmail/v1/users/me/profile', timeout=5, allow_redirects=False)
         if response.status_code in [200, 401, 403]:
             print("✅ Gmail API is accessible")
             return True
@@ -92,9 +162,19 @@ def clear_auth_cache():
     """Clear authentication cache"""
     print("\n🗑️  Clearing authentication cache...")
     
-    if os.path.exists('token.pickle'):
+    cleared = False
+    try:
+        import keyring
+        keyring.delete_password('pypost', 'gmail_creds')
+        cleared = True
+    except Exception:  # keyring missing, unusable, or holding no token
+        pass
+    
+    tokens = [path for path in ('token.json', 'token.pickle') if os.path.exists(path)]
+    if tokens or cleared:
         try:
-            os.remove('token.pickle')
+            for path in tokens:
+                os.remove(path)
             print("✅ Authentication cache cleared")
         except Exception as e:
             print(f"❌ Failed to clear cache: {str(e)}")
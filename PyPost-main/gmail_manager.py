@@ -2,19 +2,144 @@
 Gmail API Manager for handling email operations
 """
 
-import base64
-import pickle
+import contextlib
+import functools
+import hashlib
+import json
 import os
 import ssl
 import socket
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+import httplib2
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import streamlit as st
-from config import SCOPES
+from config import SCOPES, GMAIL_BATCH_SIZE, GMAIL_FETCH_WORKERS
+
+# pybase64 is a SIMD-accelerated drop-in for the stdlib module
+try:
+    import pybase64 as _b64
+except ImportError:
+    import base64 as _b64
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# The OS keyring is preferred for the OAuth token; token.json is the fallback
+try:
+    import keyring
+except ImportError:
+    keyring = None
+
+KEYRING_SERVICE = 'pypost'
+KEYRING_USERNAME = 'gmail_creds'
+
+# Body MIME types in order of preference; lower wins
+_BODY_PRIORITY = {'text/plain': 0, 'text/html': 1}
+
+# Partial-response field masks: only what extract_email_content and the callers read
+_LIST_FIELDS = 'messages(id,threadId),nextPageToken'
+_MESSAGE_FIELDS = 'id,threadId,payload'
+_HEADER_FIELDS = 'id,threadId,payload/headers'
+
+# Refresh access tokens this long before they expire
+TOKEN_REFRESH_SKEW = timedelta(seconds=60)
+
+
+def _read_token_json():
+    """Return the saved credentials JSON from the OS keyring or token.json, or None"""
+    if keyring is not None:
+        try:
+            data = keyring.get_password(KEYRING_SERVICE, KEYRING_USERNAME)
+            if data:
+                return data
+        except Exception:  # no usable keyring backend, e.g. a headless server
+            pass
+    if os.path.exists('token.json'):
+        with open('token.json') as token:
+            return token.read()
+    return None
+
+
+def _write_token_json(data):
+    """Store credentials JSON in the OS keyring, falling back to token.json"""
+    if keyring is not None:
+        try:
+            keyring.set_password(KEYRING_SERVICE, KEYRING_USERNAME, data)
+            if os.path.exists('token.json'):
+                os.remove('token.json')  # now held by the keyring
+            return
+        except Exception:
+            pass
+    with open('token.json', 'w') as token:
+        token.write(data)
+
+
+def _delete_token():
+    """Remove saved credentials from every store"""
+    if keyring is not None:
+        try:
+            keyring.delete_password(KEYRING_SERVICE, KEYRING_USERNAME)
+        except Exception:
+            pass
+    if os.path.exists('token.json'):
+        os.remove('token.json')
+    _load_token.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def _load_token(scopes):
+    """Read saved credentials once per process; raises if the saved token is unreadable"""
+    data = _read_token_json()
+    if data is None:
+        return None
+    return Credentials.from_authorized_user_info(json.loads(data), list(scopes))
+
+
+def _expires_soon(creds):
+    """Check whether the access token is missing or within the refresh skew of expiring"""
+    if creds.expiry is None:
+        return not creds.token
+    # google-auth stores expiry as naive UTC
+    return creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None) < TOKEN_REFRESH_SKEW
+
+
+@contextlib.contextmanager
+def _token_lock():
+    """Hold an exclusive file lock so concurrent app workers refresh the token only once"""
+    if fcntl is None:
+        yield
+        return
+    with open('.token.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+@st.cache_data(show_spinner=False, ttl=30)
+def _list_messages(account_key, query, max_results, _service):
+    """List message ids for an account, reused briefly across reruns"""
+    results = _service.users().messages().list(
+        userId='me', q=query, maxResults=max_results, fields=_LIST_FIELDS).execute()
+    return results.get('messages', [])
+
+
+@st.cache_data(show_spinner=False, ttl=300)
+def _headers_batch(account_key, msg_ids, _manager):
+    """Fetch list-view headers for messages, reused across reruns; headers never change"""
+    messages = _manager.get_messages_batch(
+        msg_ids, format='metadata', metadataHeaders=['Subject', 'From', 'Date'], fields=_HEADER_FIELDS)
+    return {msg_id: _manager.extract_email_content(message) for msg_id, message in messages.items()}
 
 
 class GmailManager:
@@ -23,6 +148,7 @@ class GmailManager:
     def __init__(self):
         self.service = None
         self.creds = None
+        self.account_key = None
         
     def authenticate(self):
         """Authenticate with Gmail API"""
@@ -42,45 +168,45 @@ class GmailManager:
 
             # Load or create credentials
             creds = None
-            if os.path.exists('token.pickle'):
+            try:
+                creds = _load_token(tuple(SCOPES))
+            except Exception as e:
+                st.warning(f"Could not load token: {str(e)}")
+                _delete_token()  # Remove invalid token
+            if creds is None and os.path.exists('token.pickle'):
+                creds = self._migrate_pickle_token()
+
+            # Refresh only when the access token is about to expire; if it lapses
+            # mid-session the API transport refreshes it on demand
+            if creds and creds.refresh_token and _expires_soon(creds):
                 try:
-                    with open('token.pickle', 'rb') as token:
-                        creds = pickle.load(token)
+                    creds = self._refresh_token(creds)
                 except Exception as e:
-                    st.warning(f"Could not load token: {str(e)}")
-                    os.remove('token.pickle')  # Remove invalid token
-
-            # If no valid credentials, start OAuth flow
-            if not creds or not creds.valid:
-                if creds and creds.expired and creds.refresh_token:
-                    try:
-                        creds.refresh(Request())
-                    except Exception as e:
-                        st.error(f"Error refreshing credentials: {str(e)}")
-                        os.remove('token.pickle')  # Remove invalid token
-                        creds = None
-                else:
-                    try:
-                        flow = InstalledAppFlow.from_client_secrets_file(
-                            'credentials.json', SCOPES)
-                        flow.redirect_uri = 'http://localhost:8080'
-                        creds = flow.run_local_server(port=8080)
-                        
-                        # Save credentials
-                        try:
-                            with open('token.pickle', 'wb') as token:
-                                pickle.dump(creds, token)
-                        except Exception as e:
-                            st.warning(f"Could not save credentials: {str(e)}")
-                    except Exception as e:
-                        st.error(f"Error during authentication flow: {str(e)}")
-                        return False
+                    st.error(f"Error refreshing credentials: {str(e)}")
+                    _delete_token()  # Remove invalid token
+                    creds = None
+
+            # If no usable credentials, start OAuth flow
+            if not creds or not (creds.valid or creds.refresh_token):
+                try:
+                    flow = InstalledAppFlow.from_client_secrets_file(
+                        'credentials.json', SCOPES)
+                    flow.redirect_uri = 'http://localhost:8080'
+                    creds = flow.run_local_server(port=8080)
+                    
+                    self._save_token(creds)
+                except Exception as e:
+                    st.error(f"Error during authentication flow: {str(e)}")
+                    return False
 
             if not creds:
                 st.error("Failed to obtain valid credentials.")
                 return False
 
             self.creds = creds
+            # Keeps cached API results from different accounts apart
+            self.account_key = hashlib.sha1(
+                f"{creds.client_id}:{creds.refresh_token or creds.token}".encode('utf-8')).hexdigest()
             
             # Build Gmail service
             try:
@@ -94,6 +220,42 @@ class GmailManager:
             st.error(f"Authentication error: {str(e)}")
             return False
     
+    def _save_token(self, creds):
+        """Persist credentials as JSON for the next session"""
+        try:
+            _write_token_json(creds.to_json())
+        except Exception as e:
+            st.warning(f"Could not save credentials: {str(e)}")
+        _load_token.cache_clear()
+    
+    def _refresh_token(self, creds):
+        """Refresh expiring credentials, writing them back only if the expiry changed"""
+        with _token_lock():
+            # Another worker may have refreshed the token while we waited for the lock
+            _load_token.cache_clear()
+            saved = _load_token(tuple(SCOPES))
+            if saved and not _expires_soon(saved):
+                return saved
+            expiry = creds.expiry
+            creds.refresh(Request())
+            if creds.expiry != expiry:
+                self._save_token(creds)
+        return creds
+    
+    def _migrate_pickle_token(self):
+        """Convert a token.pickle saved by older versions to JSON storage, returning the credentials"""
+        import pickle
+        try:
+            with open('token.pickle', 'rb') as token:
+                creds = pickle.load(token)
+        except Exception as e:
+            st.warning(f"Could not load token: {str(e)}")
+            creds = None
+        else:
+            self._save_token(creds)
+        os.remove('token.pickle')
+        return creds
+    
     def get_messages(self, query='', max_results=10):
         """Get messages from Gmail"""
         try:
@@ -101,10 +263,7 @@ class GmailManager:
                 st.error("Gmail service not initialized. Please authenticate first.")
                 return []
             
-            results = self.service.users().messages().list(
-                userId='me', q=query, maxResults=max_results).execute()
-            messages = results.get('messages', [])
-            return messages
+            return _list_messages(self.account_key, query, max_results, self.service)
         except HttpError as error:
             st.error(f'Gmail API error: {error}')
             return []
@@ -120,7 +279,7 @@ class GmailManager:
                 return None
             
             message = self.service.users().messages().get(
-                userId='me', id=msg_id).execute()
+                userId='me', id=msg_id, fields=_MESSAGE_FIELDS).execute()
             return message
         except HttpError as error:
             st.error(f'Gmail API error: {error}')
@@ -129,12 +288,73 @@ class GmailManager:
             st.error(f'Unexpected error getting message details: {str(e)}')
             return None
     
+    def get_messages_batch(self, msg_ids, format='full', **get_kwargs):
+        """Get many messages with batched API requests, returned as a dict keyed by message id
+        
+        Extra keyword arguments (e.g. metadataHeaders) are passed to messages().get.
+        """
+        if not self.service:
+            st.error("Gmail service not initialized. Please authenticate first.")
+            return {}
+        
+        msg_ids = list(dict.fromkeys(msg_ids))  # batch request ids must be unique
+        if format == 'full':
+            get_kwargs.setdefault('fields', _MESSAGE_FIELDS)
+        results = {}
+        failed = []
+        
+        def on_response(request_id, response, exception):
+            if exception is None:
+                results[request_id] = response
+            else:
+                failed.append(request_id)
+        
+        for start in range(0, len(msg_ids), GMAIL_BATCH_SIZE):
+            chunk = msg_ids[start:start + GMAIL_BATCH_SIZE]
+            try:
+                batch = self.service.new_batch_http_request(callback=on_response)
+                for msg_id in chunk:
+                    batch.add(self.service.users().messages().get(
+                        userId='me', id=msg_id, format=format, **get_kwargs), request_id=msg_id)
+                batch.execute()
+            except Exception:  # batch endpoint unavailable or the whole batch failed
+                failed.extend(msg_id for msg_id in chunk if msg_id not in results and msg_id not in failed)
+        
+        # Retry anything the batch endpoint rejected with individual requests
+        if failed:
+            results.update(self._get_messages_parallel(failed, format, **get_kwargs))
+        return results
+    
+    def get_headers_batch(self, msg_ids):
+        """Get subject, sender and date for many messages without downloading their bodies"""
+        return _headers_batch(self.account_key, tuple(msg_ids), self)
+    
+    def _get_messages_parallel(self, msg_ids, format='full', max_workers=GMAIL_FETCH_WORKERS, **get_kwargs):
+        """Fetch messages individually on a thread pool, skipping any that fail"""
+        def fetch(msg_id):
+            # httplib2 connections are not thread-safe, so each request gets its own
+            http = AuthorizedHttp(self.creds, http=httplib2.Http())
+            try:
+                return msg_id, self.service.users().messages().get(
+                    userId='me', id=msg_id, format=format, **get_kwargs).execute(http=http)
+            except Exception:
+                return msg_id, None
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fetched = dict(executor.map(fetch, msg_ids))
+        
+        missing = [msg_id for msg_id, message in fetched.items() if message is None]
+        if missing:
+            st.error(f'Gmail API error: could not fetch {len(missing)} message(s)')
+        return {msg_id: message for msg_id, message in fetched.items() if message is not None}
+    
     def extract_email_content(self, message):
         """Extract email content from message"""
-        headers = message['payload'].get('headers', [])
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-        sender = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown Sender')
-        date = next((h['value'] for h in headers if h['name'] == 'Date'), 'Unknown Date')
+        # Header names are case-insensitive, so index them lowercased in one pass
+        headers = {h['name'].lower(): h['value'] for h in message['payload'].get('headers', [])}
+        subject = headers.get('subject', 'No Subject')
+        sender = headers.get('from', 'Unknown Sender')
+        date = headers.get('date', 'Unknown Date')
         
         # Extract body
         body = self._extract_body(message['payload'])
@@ -149,24 +369,26 @@ class GmailManager:
         }
     
     def _extract_body(self, payload):
-        """Extract email body from payload"""
-        body = ""
+        """Extract email body from payload, preferring the first text/plain part at any depth"""
+        best_priority, best_data = len(_BODY_PRIORITY), None
+        stack = [payload]
         
-        if 'parts' in payload:
-            for part in payload['parts']:
-                if part['mimeType'] == 'text/plain':
-                    if 'data' in part['body']:
-                        body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
+        # Depth-first walk in document order; nested multiparts are common
+        while stack:
+            part = stack.pop()
+            priority = _BODY_PRIORITY.get(part.get('mimeType'))
+            if priority is not None and priority < best_priority:
+                data = part.get('body', {}).get('data')
+                if data:
+                    best_priority, best_data = priority, data
+                    if priority == 0:
                         break
-                elif part['mimeType'] == 'text/html':
-                    if 'data' in part['body']:
-                        body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8')
-        else:
-            if payload['mimeType'] == 'text/plain':
-                if 'data' in payload['body']:
-                    body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8')
+            stack.extend(reversed(part.get('parts', [])))
         
-        return body
+        # Only the winning part is decoded
+        if best_data:
+            return _b64.urlsafe_b64decode(best_data).decode('utf-8')
+        return ""
     
     def send_reply(self, thread_id, to_email, subject, body):
         """Send a reply to an email"""
@@ -175,15 +397,16 @@ class GmailManager:
                 st.error("Gmail service not initialized. Please authenticate first.")
                 return None
             
+            # EmailMessage takes care of encoding non-ASCII headers and bodies
+            reply = EmailMessage()
+            reply['To'] = to_email
+            reply['Subject'] = f'Re: {subject}'
+            reply['In-Reply-To'] = thread_id
+            reply['References'] = thread_id
+            reply.set_content(body)
+            
             message = {
-                'raw': base64.urlsafe_b64encode(
-                    f'To: {to_email}\r\n'
-                    f'Subject: Re: {subject}\r\n'
-                    f'In-Reply-To: {thread_id}\r\n'
-                    f'References: {thread_id}\r\n'
-                    f'\r\n'
-                    f'{body}'.encode('utf-8')
-                ).decode('utf-8')
+                'raw': _b64.urlsafe_b64encode(reply.as_bytes()).decode('ascii')
             }
             
             result = self.service.users().messages().send(
@@ -196,8 +419,10 @@ class GmailManager:
             st.error(f'Unexpected error sending reply: {str(e)}')
             return None
     
-    def extract_sender_email(self, sender):
-        """Extract email address from sender string"""
-        if '<' in sender and '>' in sender:
-            return sender.split('<')[1].split('>')[0]
-        return sender 
\ No newline at end of file
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def extract_sender_email(sender):
+        """Extract email address from sender string; the same senders recur across a mailbox"""
+        _, _, rest = sender.partition('<')
+        address, found, _ = rest.partition('>')
+        return address if found else sender 
\ No newline at end of file
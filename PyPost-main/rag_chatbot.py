@@ -2,23 +2,65 @@
 RAG (Retrieval-Augmented Generation) Chatbot for Email Analysis
 """
 
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 from typing import List, Dict, Any, Optional
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
 from config import EMAIL_CATEGORIES
+from embeddings import get_embedder, load_embedding_store
+
+# Number of distinct email selections whose FAISS index is kept per chatbot
+INDEX_CACHE_SIZE = 8
+
+# Embeddings kept per chatbot by text hash, least recently used dropped first
+TEXT_VECTOR_CACHE_SIZE = 2000
+
+# Above this many emails, search a graph index instead of scanning every vector
+HNSW_MIN_EMAILS = 10000
+
+# Shared by all sessions so concurrent questions queue for the CPU instead of
+# oversubscribing it; encode and FAISS search both release the GIL while they run
+_EXEC = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rag-search")
+
+# Layout of one email in the prompt context
+_CTX_FMT = """
+Email {i}:
+- Subject: {subject}
+- From: {sender}
+- Date: {date}
+- Content: {body}
+---"""
+
+
+def _emails_key(emails: List[Dict[str, Any]]) -> str:
+    """Identify a set of emails independent of their order"""
+    ids = ",".join(sorted(e.get('id', '') for e in emails))
+    return hashlib.blake2b(ids.encode('utf-8'), digest_size=16).hexdigest()
+
 
 class EmailRAGChatbot:
     """RAG Chatbot for querying email content using various AI providers and FAISS"""
     
-    def __init__(self, ai_provider):
-        """Initialize the RAG Chatbot with an AI provider"""
+    def __init__(self, ai_provider, account_key=None):
+        """Initialize the RAG Chatbot with an AI provider and the Gmail account whose emails it indexes"""
         self.ai_provider = ai_provider
-        self.embedder = SentenceTransformer('all-MiniLM-L6-v2')
+        self.account_key = account_key
+        self.embedder = get_embedder()
         self.faiss_index = None
         self.email_vectors = None
         self.emails = []
+        # Built indexes keyed by email selection, and embeddings keyed by email id
+        # (shared by the account's sessions and persisted to disk)
+        self._index_cache: Dict[str, tuple] = {}
+        self._vector_cache = load_embedding_store(account_key)
+        # Embeddings keyed by a hash of the embedded text, so repeated newsletters
+        # and auto-replies with new ids are only encoded once
+        self._vec_by_key: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        # Ids of the emails in the current index, to skip rebuilding for the same selection
+        self._indexed_ids: Optional[frozenset] = None
     
     def build_faiss_index(self, emails: List[Dict[str, Any]]):
         """Build a FAISS index for the given emails"""
@@ -26,20 +68,78 @@ class EmailRAGChatbot:
         if not emails:
             self.faiss_index = None
             self.email_vectors = None
+            self._indexed_ids = None
+            return
+        key = _emails_key(emails)
+        cached = self._index_cache.get(key)
+        if cached:
+            self.faiss_index, self.email_vectors, self.emails = cached
+            self._indexed_ids = frozenset(e.get('id', '') for e in emails)
             return
-        texts = [f"Subject: {e.get('subject','')}\nBody: {e.get('body','')}" for e in emails]
-        vectors = self.embedder.encode(texts, show_progress_bar=False)
-        self.email_vectors = np.array(vectors).astype('float32')
-        self.faiss_index = faiss.IndexFlatL2(self.email_vectors.shape[1])
-        self.faiss_index.add(self.email_vectors)
+        
+        # Only encode emails that have not been embedded before
+        vectors_by_id = self._vector_cache.get_many([e.get('id', '') for e in emails])
+        new_emails = [e for e in emails if e.get('id', '') not in vectors_by_id]
+        if new_emails:
+            texts = [f"Subject: {e.get('subject','')}\nBody: {e.get('body','')}" for e in new_emails]
+            keys = [hashlib.blake2b(t.encode('utf-8'), digest_size=16).digest() for t in texts]
+            by_key = {key: self._vec_by_key[key] for key in keys if key in self._vec_by_key}
+            pending = {key: text for key, text in zip(keys, texts) if key not in by_key}
+            if pending:
+                vectors = self.embedder.encode(list(pending.values()), show_progress_bar=False, batch_size=64,
+                                               normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False)
+                by_key.update(zip(pending, vectors))
+            for key, vector in by_key.items():
+                self._vec_by_key[key] = vector
+                self._vec_by_key.move_to_end(key)
+            while len(self._vec_by_key) > TEXT_VECTOR_CACHE_SIZE:
+                self._vec_by_key.popitem(last=False)
+            new_vectors = {email.get('id', ''): by_key[key] for email, key in zip(new_emails, keys)}
+            vectors_by_id.update(new_vectors)
+            self._vector_cache.update(new_vectors)
+            try:
+                self._vector_cache.save()
+            except OSError as e:
+                st.warning(f"Could not save email embeddings: {str(e)}")
+        
+        vectors = np.stack([vectors_by_id[e.get('id', '')] for e in emails])
+        # Vectors are normalized, so inner product is cosine similarity; the index
+        # stores them as 8-bit codes, a quarter of the float32 size
+        dim = vectors.shape[1]
+        if len(emails) > HNSW_MIN_EMAILS:
+            self.faiss_index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, 32,
+                                                 faiss.METRIC_INNER_PRODUCT)
+        else:
+            self.faiss_index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit,
+                                                          faiss.METRIC_INNER_PRODUCT)
+        self.faiss_index.train(vectors)
+        self.faiss_index.add(vectors)
+        # The index owns the quantized copy, so the float matrix is not kept
+        self.email_vectors = None
+        
+        if len(self._index_cache) >= INDEX_CACHE_SIZE:
+            self._index_cache.pop(next(iter(self._index_cache)))
+        self._index_cache[key] = (self.faiss_index, self.email_vectors, emails)
+        self._indexed_ids = frozenset(e.get('id', '') for e in emails)
+    
+    def _ensure_index(self, emails: List[Dict[str, Any]]):
+        """Build the index only when the email selection has changed"""
+        if frozenset(e.get('id', '') for e in emails) != self._indexed_ids:
+            self.build_faiss_index(emails)
     
     def search_emails_faiss(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """Search emails using FAISS semantic search"""
         if not self.faiss_index or not self.emails:
             return []
-        query_vec = self.embedder.encode([query]).astype('float32')
-        D, I = self.faiss_index.search(query_vec, top_k)
-        return [self.emails[i] for i in I[0] if i < len(self.emails)]
+        index, emails = self.faiss_index, self.emails
+        D, I = _EXEC.submit(self._search, index, query, top_k).result()
+        # FAISS pads missing results with -1 when top_k exceeds the index size
+        return [emails[i] for i in I[0] if 0 <= i < len(emails)]
+    
+    def _search(self, index, query: str, top_k: int):
+        """Embed the query and search the index; runs on the shared search pool"""
+        query_vec = self.embedder.encode([query], normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False)
+        return index.search(query_vec, top_k)
     
     def _generate_response(self, prompt: str, **kwargs) -> str:
         """Generate a response using the configured AI provider"""
@@ -49,28 +149,34 @@ class EmailRAGChatbot:
             st.error(f"Error generating response: {str(e)}")
             return f"Sorry, I couldn't generate a response at this time. Error: {str(e)}"
     
+    def _stream_response(self, prompt: str, **kwargs):
+        """Stream a response from the configured AI provider"""
+        try:
+            yield from self.ai_provider.stream_response(prompt, **kwargs)
+        except Exception as e:
+            st.error(f"Error generating response: {str(e)}")
+            yield f"Sorry, I couldn't generate a response at this time. Error: {str(e)}"
+    
     def create_email_context(self, emails: List[Dict[str, Any]]) -> str:
         if not emails:
             return "No emails available for context."
-        context_parts = []
-        for i, email in enumerate(emails, 1):
-            context_parts.append(f"""
-Email {i}:
-- Subject: {email.get('subject', 'No Subject')}
-- From: {email.get('sender', 'Unknown Sender')}
-- Date: {email.get('date', 'Unknown Date')}
-- Content: {email.get('body', 'No content')}
----""")
-        return "\n".join(context_parts)
+        return "\n".join(
+            _CTX_FMT.format(
+                i=i,
+                subject=email.get('subject', 'No Subject'),
+                sender=email.get('sender', 'Unknown Sender'),
+                date=email.get('date', 'Unknown Date'),
+                body=email.get('body', 'No content'),
+            )
+            for i, email in enumerate(emails, 1)
+        )
     
-    def answer_question(self, question: str, emails: List[Dict[str, Any]]) -> str:
-        if not emails:
-            return "No emails are available to answer your question. Please select some emails first."
+    def _answer_prompt(self, question: str, emails: List[Dict[str, Any]]) -> str:
         # Use FAISS to select the most relevant emails for the question
-        self.build_faiss_index(emails)
+        self._ensure_index(emails)
         relevant_emails = self.search_emails_faiss(question, top_k=min(5, len(emails)))
         context = self.create_email_context(relevant_emails)
-        prompt = f"""
+        return f"""
 You are an AI assistant that helps users understand their emails. You have access to the following email context:
 
 {context}
@@ -86,7 +192,18 @@ Please provide a comprehensive answer based on the email context above. Your res
 5. If the question cannot be answered with the provided context, say so clearly
 
 Answer:"""
-        return self._generate_response(prompt)
+    
+    def answer_question(self, question: str, emails: List[Dict[str, Any]]) -> str:
+        if not emails:
+            return "No emails are available to answer your question. Please select some emails first."
+        return self._generate_response(self._answer_prompt(question, emails))
+    
+    def answer_question_stream(self, question: str, emails: List[Dict[str, Any]]):
+        """Answer a question about the emails, yielding text as it is generated"""
+        if not emails:
+            yield "No emails are available to answer your question. Please select some emails first."
+            return
+        yield from self._stream_response(self._answer_prompt(question, emails))
     
     def suggest_questions(self, emails: List[Dict[str, Any]]) -> List[str]:
         if not emails:
@@ -97,7 +214,6 @@ Answer:"""
                 "What meetings or events are mentioned?",
                 "Are there any action items I need to follow up on?"
             ]
-        self.build_faiss_index(emails[:5])
         context = self.create_email_context(emails[:5])
         prompt = f"""
 Based on these emails:
@@ -142,5 +258,5 @@ Please provide a structured analysis with clear sections."""
     def search_emails_by_content(self, query: str, emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         if not emails:
             return []
-        self.build_faiss_index(emails)
+        self._ensure_index(emails)
         return self.search_emails_faiss(query, top_k=10) 
\ No newline at end of file
@@ -2,6 +2,7 @@
 Settings UI Module
 Handles the user interface for application settings including AI provider selection.
 """
+from dataclasses import dataclass
 import streamlit as st
 from config import AI_PROVIDERS, AI_CONFIG, DEFAULT_AI_PROVIDER
 
@@ -78,6 +79,7 @@ def show_ai_settings():
         if api_key != st.session_state[f"{api_key_env}_input"]:
             st.session_state[f"{api_key_env}_input"] = api_key
             st.session_state[f"{selected_provider.upper()}_API_KEY"] = api_key
+            # The new key changes the AI settings, so app.py rebuilds the session's provider
             st.success(f"✅ {selected_provider} API key saved")
         
         # Model selection in an expander
@@ -148,8 +150,21 @@ def show_ai_settings():
             
             st.markdown("\n**Note:** Your API key is stored only in your browser session and is never sent to our servers.")
 
+@dataclass(frozen=True)
+class AISettings:
+    """Immutable snapshot of the AI settings chosen in the sidebar"""
+    provider: str
+    api_key: str
+    model: str
+    temperature: float
+    max_tokens: int
+
 def get_ai_settings():
-    """Get the current AI settings from session state."""
+    """Get the current AI settings from session state.
+    
+    The same AISettings object is returned until a setting changes, so it can be
+    used as a stable cache key.
+    """
     provider = st.session_state.get('selected_ai_provider', DEFAULT_AI_PROVIDER)
     api_key = st.session_state.get(f"{AI_CONFIG[provider]['api_key_env']}_input", "")
     
@@ -160,10 +175,16 @@ def get_ai_settings():
     elif not selected_model:
         selected_model = AI_CONFIG[provider].get('model', '')
     
-    return {
-        'provider': provider,
-        'api_key': api_key,
-        'model': selected_model,
-        'temperature': st.session_state.get('temperature_setting', 0.7),
-        'max_tokens': st.session_state.get('max_tokens_setting', 1000)
-    }
+    settings = AISettings(
+        provider=provider,
+        api_key=api_key,
+        model=selected_model,
+        temperature=st.session_state.get('temperature_setting', 0.7),
+        max_tokens=st.session_state.get('max_tokens_setting', 1000)
+    )
+    
+    cached = st.session_state.get('_ai_settings')
+    if cached == settings:
+        return cached
+    st.session_state['_ai_settings'] = settings
+    return settings
@@ -2,35 +2,170 @@
 Simplified UI Components for the Gmail AI Assistant
 """
 
+import re
 import streamlit as st
+from collections import Counter
 from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple, Any
-from config import SEARCH_EXAMPLES, REPLY_TONES
+from config import SEARCH_EXAMPLES, REPLY_TONES, EMAILS_PER_PAGE, EMAIL_PREVIEW_CHARS, MESSAGE_CACHE_SIZE
+from cache import LRUCache
+from utils import ProbeResult, run_probes, get_network_info, handle_ssl_error
 
-# Utility to clear only relevant session state keys
-def clear_tab_state(prefix: str) -> None:
-    """Clear session state keys with the given prefix"""
-    keys_to_clear = [k for k in st.session_state.keys() if k.startswith(prefix)]
-    for k in keys_to_clear:
-        del st.session_state[k]
+@st.cache_resource(show_spinner=False)
+def _content_cache() -> LRUCache:
+    """Parsed messages keyed by (account, message id) so mailboxes never mix, reused across reruns"""
+    return LRUCache(MESSAGE_CACHE_SIZE)
+
+
+def fetch_email_contents(gmail_manager, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Get the parsed content of listed messages, batch-fetching only the ones not cached yet"""
+    account_key = gmail_manager.account_key
+    cache = _content_cache()
+    contents = {}
+    for msg in messages:
+        content = cache.get((account_key, msg['id']))
+        if content is not None:
+            contents[msg['id']] = content
+    
+    missing = [msg['id'] for msg in messages if msg['id'] not in contents]
+    if missing:
+        for msg_id, details in gmail_manager.get_messages_batch(missing).items():
+            content = gmail_manager.extract_email_content(details)
+            # Build the list preview once here instead of slicing the body on every render
+            body = content['body']
+            content['preview'] = body[:EMAIL_PREVIEW_CHARS] + "..." if len(body) > EMAIL_PREVIEW_CHARS else body
+            cache.put((account_key, msg_id), content)
+            contents[msg_id] = content
+    # Messages that failed to download are skipped, as the batch fetch does
+    return [contents[msg['id']] for msg in messages if msg['id'] in contents]
+
+
+def paginate(items: List[Any], key: str, page_size: int = EMAILS_PER_PAGE) -> List[Any]:
+    """Return the items on the page picked with a page selector, so only one page is rendered"""
+    pages = max(1, -(-len(items) // page_size))
+    if pages == 1:
+        return items
+    # The page lives only in session_state (no widget value=), kept valid when the list shrinks
+    st.session_state[key] = min(st.session_state.get(key, 1), pages)
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key=key)
+    return items[(page - 1) * page_size:page * page_size]
+
+
+# Email list actions and the session key each one hands the email to
+EMAIL_ACTIONS = {
+    "Reply": "current_reply_email",
+    "Summarize": "current_summary_email",
+    "Categorize": "current_category_email",
+    "Analyze": "current_sentiment_email",
+}
+
+
+def _dispatch_action(email: Dict[str, Any]) -> None:
+    """Hand the email to the tab for the action picked in its selectbox"""
+    key = f"act_{email['id']}"
+    action = st.session_state.get(key)
+    if action in EMAIL_ACTIONS:
+        st.session_state[EMAIL_ACTIONS[action]] = email
+    # Reset the picker so the same action can be chosen again
+    st.session_state[key] = "—"
+
+
+# Styles for the email list, built once at import
+_CSS_BLOB = """
+<style>
+    .email-card {
+        transition: all 0.2s ease-in-out;
+    }
+    .email-card:hover {
+        transform: translateY(-2px);
+        box-shadow: 0 4px 12px rgba(0,0,0,0.08);
+    }
+    .email-action-btn {
+        background: none;
+        border: none;
+        font-size: 1.1rem;
+        cursor: pointer;
+        opacity: 0.6;
+        transition: all 0.2s;
+    }
+    .email-action-btn:hover {
+        opacity: 1;
+        transform: scale(1.1);
+    }
+    .action-btn {
+        background: #F1F5F9;
+        border: 1px solid #E2E8F0;
+        border-radius: 6px;
+        padding: 0.35rem 0.75rem;
+        font-size: 0.85rem;
+        color: #475569;
+        cursor: pointer;
+        transition: all 0.2s;
+        display: flex;
+        align-items: center;
+        gap: 0.4rem;
+    }
+    .action-btn:hover {
+        background: #E2E8F0;
+    }
+</style>
+"""
+
+
+def render_probe(result: ProbeResult, success: str, failure: str) -> None:
+    """Show a connectivity probe's outcome, with the reason when it failed"""
+    if result.ok:
+        st.success(success)
+    else:
+        st.error(f"{failure}: {result.error}" if result.error else failure)
+
+
+# Utility to clear a tab's selected email
+def clear_tab_state(key: str) -> None:
+    """Clear the tab's session state key, if it is set"""
+    st.session_state.pop(key, None)
+
+# Gmail query for each email list view
+_VIEW_QUERIES = {"All": "", "Unread": "is:unread", "Starred": "is:starred", "Important": "is:important"}
+
+# Search keywords and the Gmail query they expand to, in priority order
+_SEARCH_SHORTCUTS = (
+    (re.compile(r'jobs|career', re.IGNORECASE),
+     "from:(linkedin.com OR indeed.com OR glassdoor.com) OR subject:(job OR career OR opportunity OR hiring)"),
+    (re.compile(r'meeting', re.IGNORECASE), "subject:(meeting OR call OR zoom OR teams)"),
+    (re.compile(r'urgent', re.IGNORECASE), "subject:(urgent OR important OR ASAP)"),
+    (re.compile(r'newsletter', re.IGNORECASE), "subject:(newsletter OR update OR digest)"),
+)
+
+# Category line of an AI categorization response
+_CATEGORY_RE = re.compile(r'Category:\s*([^\n]+)')
+
+# Sender keyword patterns and their icons, in priority order
+_SENDER_ICONS = (
+    (re.compile(r'support|help|service', re.IGNORECASE), '🛟'),
+    (re.compile(r'notification|alert|update', re.IGNORECASE), '🔔'),
+    (re.compile(r'news|blog', re.IGNORECASE), '📰'),
+    (re.compile(r'team|hr|people', re.IGNORECASE), '👥'),
+)
 
 def get_icon_for_sender(sender: str) -> str:
     """Get an appropriate icon for the email sender"""
-    sender_lower = sender.lower()
-    if any(domain in sender_lower for domain in ['support', 'help', 'service']):
-        return '🛟'
-    elif any(domain in sender_lower for domain in ['notification', 'alert', 'update']):
-        return '🔔'
-    elif any(domain in sender_lower for domain in ['news', 'update', 'blog']):
-        return '📰'
-    elif any(domain in sender_lower for domain in ['team', 'hr', 'people']):
-        return '👥'
+    for pattern, icon in _SENDER_ICONS:
+        if pattern.search(sender):
+            return icon
     return '✉️'
 
+@lru_cache(maxsize=4096)
+def _parse_email_date(date_str: str) -> datetime:
+    """Parse an RFC 2822 date header; the same headers recur on every rerun"""
+    return parsedate_to_datetime(date_str)
+
 def format_date(date_str: str) -> str:
     """Format date string to a more readable format"""
     try:
-        date_obj = datetime.strptime(date_str, '%a, %d %b %Y %H:%M:%S %z')
+        date_obj = _parse_email_date(date_str)
         now = datetime.now(date_obj.tzinfo)
         
         if date_obj.date() == now.date():
@@ -80,93 +215,91 @@ def render_sidebar_config():
     return gemini_api_key
 
 
+# Static welcome-page content, built once at import
+_SETUP_INTRO_MD = """
+## Get Started with AI-Powered Email Management
+
+This application helps you manage your Gmail inbox using advanced AI capabilities from multiple providers.
+Choose the AI provider that best suits your needs and budget.
+
+## Supported AI Providers
+"""
+
+_PROVIDER_SECTIONS = (
+    ("🤖 Google Gemini", """
+**Free Models Available:**
+- Gemini 2.5 Flash (Recommended)
+- Gemini 1.5 Pro
+
+**Paid Models:**
+- Gemini 2.0 Pro
+- Gemini 1.0 Ultra
+
+[Get API Key](https://makersuite.google.com/app/apikey)
+"""),
+    ("🔮 OpenAI", """
+**Free Tier Available** (with limitations)
+
+**Models:**
+- GPT-4o (Recommended)
+- GPT-4
+- GPT-3.5 Turbo
+
+[Get API Key](https://platform.openai.com/api-keys)
+"""),
+    ("🤖 Anthropic Claude", """
+**Free Trial Available**
+
+**Models:**
+- Claude 3 Opus
+- Claude 3 Sonnet
+- Claude 3 Haiku
+
+[Get API Key](https://console.anthropic.com/settings/keys)
+"""),
+    ("🚀 xAI Grok", """
+**Currently in Beta**
+
+**Models:**
+- Grok-1.5
+- Grok-1.5 Vision
+
+[Learn More](https://x.ai/)
+"""),
+)
+
+_SETUP_STEPS_MD = """
+## Setup Instructions
+
+1. **Choose an AI Provider** and get your API key from their website
+2. Enter your API key in the sidebar
+3. Download your Gmail API `credentials.json` from [Google Cloud Console](https://console.cloud.google.com/)
+4. Place `credentials.json` in the same directory as this app
+5. Install required packages:
+   ```bash
+   pip install -r requirements.txt
+   ```
+6. Run the app: `streamlit run app.py`
+7. Authenticate with Gmail when prompted
+"""
+
+
 def render_setup_instructions():
     """Render setup instructions when API key is not provided"""
     st.title("Welcome to Gmail AI Assistant")
     
-    # Introduction
-    st.markdown("""
-    ## Get Started with AI-Powered Email Management
-    
-    This application helps you manage your Gmail inbox using advanced AI capabilities from multiple providers.
-    Choose the AI provider that best suits your needs and budget.
-    """)
-    
-    # AI Provider Information
-    st.markdown("## Supported AI Providers")
-    
-    # Create columns for each provider
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        with st.expander("🤖 Google Gemini", expanded=True):
-            st.markdown("""
-            **Free Models Available:**
-            - Gemini 2.5 Flash (Recommended)
-            - Gemini 1.5 Pro
-            
-            **Paid Models:**
-            - Gemini 2.0 Pro
-            - Gemini 1.0 Ultra
-            
-            [Get API Key](https://makersuite.google.com/app/apikey)
-            """)
-    
-    with col2:
-        with st.expander("🔮 OpenAI", expanded=True):
-            st.markdown("""
-            **Free Tier Available** (with limitations)
-            
-            **Models:**
-            - GPT-4o (Recommended)
-            - GPT-4
-            - GPT-3.5 Turbo
-            
-            [Get API Key](https://platform.openai.com/api-keys)
-            """)
+    # Introduction and AI provider information
+    st.markdown(_SETUP_INTRO_MD)
     
-    col3, col4 = st.columns(2)
-    
-    with col3:
-        with st.expander("🤖 Anthropic Claude", expanded=True):
-            st.markdown("""
-            **Free Trial Available**
-            
-            **Models:**
-            - Claude 3 Opus
-            - Claude 3 Sonnet
-            - Claude 3 Haiku
-            
-            [Get API Key](https://console.anthropic.com/settings/keys)
-            """)
-    
-    with col4:
-        with st.expander("🚀 xAI Grok", expanded=True):
-            st.markdown("""
-            **Currently in Beta**
-            
-            **Models:**
-            - Grok-1.5
-            - Grok-1.5 Vision
-            
-            [Learn More](https://x.ai/)
-            """)
+    # Two providers per row
+    for row in (_PROVIDER_SECTIONS[:2], _PROVIDER_SECTIONS[2:]):
+        for col, (title, body) in zip(st.columns(2), row):
+            with col:
+                with st.expander(title, expanded=True):
+                    st.markdown(body)
     
     # Setup Instructions
-    st.markdown("""
-    ## Setup Instructions
-    
-    1. **Choose an AI Provider** and get your API key from their website
-    2. Enter your API key in the sidebar
-    3. Download your Gmail API `credentials.json` from [Google Cloud Console](https://console.cloud.google.com/)
-    4. Place `credentials.json` in the same directory as this app
-    5. Install required packages:
-       ```bash
-       pip install -r requirements.txt
-       ```
-    6. Run the app: `streamlit run app.py`
-    7. Authenticate with Gmail when prompted
-    """)
+    st.markdown(_SETUP_STEPS_MD)
 
 
 def render_authentication_section(gmail_manager):
@@ -177,28 +310,20 @@ def render_authentication_section(gmail_manager):
     if not st.session_state.authenticated:
         # Network diagnostics section
         with st.expander("🔧 Network Diagnostics", expanded=False):
-            from utils import test_network_connectivity, check_gmail_api_access, get_network_info, handle_ssl_error
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                if st.button("🌐 Test Internet Connection"):
-                    if test_network_connectivity():
-                        st.success("✅ Internet connection is working")
-                    else:
-                        st.error("❌ Internet connection failed")
-            
-            with col2:
-                if st.button("📧 Test Gmail API Access"):
-                    if check_gmail_api_access():
-                        st.success("✅ Gmail API is accessible")
-                    else:
-                        st.error("❌ Gmail API access failed")
+            # Both probes run at once, so the wait is the slower of the two
+            if st.button("🌐 Test Internet and Gmail API Access"):
+                internet, gmail = run_probes()
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    render_probe(internet, "✅ Internet connection is working", "❌ Internet connection failed")
+                
+                with col2:
+                    render_probe(gmail, "✅ Gmail API is accessible", "❌ Gmail API access failed")
             
             # Show network info
-            network_info = get_network_info()
             st.write("**Network Information:**")
-            for key, value in network_info.items():
+            for key, value in get_network_info().items():
                 st.write(f"- {key}: {value}")
         
         if st.button("🔐 Authenticate with Gmail"):
@@ -241,151 +366,37 @@ def render_email_list_tab(gmail_manager, email_ai):
     max_emails = st.slider("Number of emails to display", 1, 100, 50)
     
     # Fetch emails based on view mode
-    emails = []
-    query = ""
-    
-    if view_mode == "All":
-        query = ""
-    elif view_mode == "Unread":
-        query = "is:unread"
-    elif view_mode == "Starred":
-        query = "is:starred"
-    elif view_mode == "Important":
-        query = "is:important"
+    query = _VIEW_QUERIES.get(view_mode, "")
     
     messages = gmail_manager.get_messages(query=query, max_results=max_emails)
     
     # Process messages to get email details
-    for msg in messages:
-        email_details = gmail_manager.get_message_details(msg['id'])
-        if email_details:
-            content = gmail_manager.extract_email_content(email_details)
-            emails.append(content)
+    emails = fetch_email_contents(gmail_manager, messages)
     
-    # Display emails in a simple list
-    for email in emails:
+    # Display one page of emails in a simple list
+    for email in paginate(emails, "email_list_page"):
         with st.expander(f"📧 {email['subject']}"):
-            st.write(f"From: {email['sender']}")
-            st.write(f"Date: {email['date']}")
-            st.write(f"Content: {email['body'][:500]}...")
+            # One markdown block per email instead of a write call per line
+            st.markdown(f"**From:** {email['sender']}  \n**Date:** {email['date']}  \n\n{email['preview']}")
             
-            # Email actions
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                if st.button("Reply"):
-                    st.session_state[f"email_to_reply_{email['id']}"] = email
-                    st.rerun()
-            with col2:
-                if st.button("Summarize"):
-                    st.session_state[f"email_to_summarize_{email['id']}"] = email
-                    st.rerun()
-            with col3:
-                if st.button("Analyze"):
-                    st.session_state[f"email_to_analyze_{email['id']}"] = email
-                    st.rerun()
-                st.write(email.get('body', 'No content'))
-                
-                # Add action buttons
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.button(f"Reply to this email", key=f"reply_{i}"):
-                        st.session_state.replying_to = email
-                with col2:
-                    if st.button(f"Forward this email", key=f"forward_{i}"):
-                        st.session_state.forwarding = email
+            # One action picker per email instead of a row of buttons
+            st.selectbox(
+                "Action",
+                ["—", *EMAIL_ACTIONS],
+                key=f"act_{email['id']}",
+                label_visibility="collapsed",
+                on_change=_dispatch_action,
+                args=(email,),
+            )
                 
-                # Add additional actions
-                with st.expander("More actions"):
-                    col1, col2 = st.columns(2)
-                    with col1:
-                        if st.button(f"⭐ Star email", key=f"star_{i}"):
-                            st.session_state.email_action = f"star_{i}"
-                        if st.button(f"📝 Summarize email", key=f"summarize_{i}"):
-                            st.session_state.email_action = f"summarize_{i}"
-                    with col2:
-                        if st.button(f"🗄️ Archive email", key=f"archive_{i}"):
-                            st.session_state.email_action = f"archive_{i}"
-                
-                # Add some spacing between emails
-                st.write("")
-                st.write("---")
-                
-                # Handle email actions
-                if f'email_action' in st.session_state:
-                    action, idx = st.session_state.email_action.split('_')
-                    if int(idx) == i:
-                        if action == 'summarize':
-                            clear_tab_state("email_to_summarize_")
-                            st.session_state[f"email_to_summarize_{i}"] = email
-                            st.session_state.active_tab = 'summaries'
-                            del st.session_state['email_action']
-                            st.rerun()
-                        elif action == 'reply':
-                            clear_tab_state("email_to_reply_")
-                            st.session_state[f"email_to_reply_{i}"] = email
-                            st.session_state.active_tab = 'smart_reply'
-                            del st.session_state['email_action']
-                            st.rerun()
+            # Add some spacing between emails
+            st.divider()
     
     # Add custom CSS for email cards
-    st.markdown("""
-    <style>
-        .email-card {
-            transition: all 0.2s ease-in-out;
-        }
-        .email-card:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.08);
-        }
-        .email-action-btn {
-            background: none;
-            border: none;
-            font-size: 1.1rem;
-            cursor: pointer;
-            opacity: 0.6;
-            transition: all 0.2s;
-        }
-        .email-action-btn:hover {
-            opacity: 1;
-            transform: scale(1.1);
-        }
-        .action-btn {
-            background: #F1F5F9;
-            border: 1px solid #E2E8F0;
-            border-radius: 6px;
-            padding: 0.35rem 0.75rem;
-            font-size: 0.85rem;
-            color: #475569;
-            cursor: pointer;
-            transition: all 0.2s;
-            display: flex;
-            align-items: center;
-            gap: 0.4rem;
-        }
-        .action-btn:hover {
-            background: #E2E8F0;
-        }
-    </style>
-    <script>
-    // Make sure Streamlit is defined
-    if (window.Streamlit) {
-        window.streamlitRun = function(code) {
-            const script = document.createElement('script');
-            script.type = 'text/plain';
-            script.text = code;
-            document.body.appendChild(script);
-            window.parent.postMessage({
-                type: 'streamlit:runScript',
-                data: script.text
-            }, '*');
-            document.body.removeChild(script);
-        }
-    }
-    </script>
-    """, unsafe_allow_html=True)
+    st.markdown(_CSS_BLOB, unsafe_allow_html=True)
     
     # Add a nice empty state if no emails match the filter
-    if not messages or (view_mode == "Unread" and not any(email.get('unread', False) for email in emails_data)):
+    if not emails:
         st.markdown("""
         <div style="
             text-align: center;
@@ -424,112 +435,88 @@ def render_smart_search_tab(gmail_manager, email_ai):
     if search_query:
         if st.button("🔍 Search"):
             # Convert natural language to Gmail search query
-            if "jobs" in search_query.lower() or "career" in search_query.lower():
-                gmail_query = "from:(linkedin.com OR indeed.com OR glassdoor.com) OR subject:(job OR career OR opportunity OR hiring)"
-            elif "meeting" in search_query.lower():
-                gmail_query = "subject:(meeting OR call OR zoom OR teams)"
-            elif "urgent" in search_query.lower():
-                gmail_query = "subject:(urgent OR important OR ASAP)"
-            elif "newsletter" in search_query.lower():
-                gmail_query = "subject:(newsletter OR update OR digest)"
-            else:
-                gmail_query = search_query
+            gmail_query = next((shortcut for pattern, shortcut in _SEARCH_SHORTCUTS
+                                if pattern.search(search_query)), search_query)
             
             with st.spinner("Searching emails..."):
                 messages = gmail_manager.get_messages(query=gmail_query, max_results=20)
-            
-            if messages:
-                st.success(f"Found {len(messages)} emails matching your search.")
-                
-                for msg in messages:
-                    email_details = gmail_manager.get_message_details(msg['id'])
-                    if email_details:
-                        content = gmail_manager.extract_email_content(email_details)
-                        with st.expander(f"📧 {content['subject']} - {content['sender']}"):
-                            st.write(f"**From:** {content['sender']}")
-                            st.write(f"**Date:** {content['date']}")
-                            st.write(f"**Subject:** {content['subject']}")
-                            st.text(content['body'][:300] + "..." if len(content['body']) > 300 else content['body'])
-            else:
-                st.info("No emails found matching your search criteria.")
+                # Kept in the session so changing pages doesn't lose the results
+                st.session_state.search_results = fetch_email_contents(gmail_manager, messages) if messages else []
+                st.session_state.pop("search_page", None)
+    
+    results = st.session_state.get("search_results")
+    if results is None:
+        return
+    
+    if results:
+        st.success(f"Found {len(results)} emails matching your search.")
+        
+        for content in paginate(results, "search_page"):
+            with st.expander(f"📧 {content['subject']} - {content['sender']}"):
+                st.markdown(f"**From:** {content['sender']}  \n**Date:** {content['date']}  \n"
+                            f"**Subject:** {content['subject']}")
+                st.text(content['preview'])
+    else:
+        st.info("No emails found matching your search criteria.")
 
 
 def render_summaries_tab(email_ai):
     """Render the summaries tab"""
     st.header("Email Summaries")
     
-    found = False
-    for key in st.session_state.keys():
-        if key.startswith("email_to_summarize_"):
-            found = True
-            email = st.session_state[key]
-            st.subheader(f"Summary for: {email['subject']}")
-            
-            with st.spinner("Generating summary with Gemini..."):
-                summary = email_ai.summarize_email(email)
-            
-            st.write("**AI Summary:**")
-            st.write(summary)
-            
-            # Extract action items
-            with st.spinner("Extracting action items..."):
-                actions = email_ai.extract_action_items(email)
-            
-            st.write("**Action Items:**")
-            st.write(actions)
-            
-            if st.button("Clear Summary Result"):
-                clear_tab_state("email_to_summarize_")
-                st.rerun()
-            break
-    if not found:
-        st.info("Select an email from the Email List tab to summarize.")
+    email = st.session_state.get("current_summary_email")
+    if email is None:
+        st.info("Select an email from the Email List tab to summarize.")
+        return
+    
+    st.subheader(f"Summary for: {email['subject']}")
+    
+    # The summary and the action items come from one streamed response
+    st.write_stream(email_ai.summarize_with_actions_stream(email))
+    
+    if st.button("Clear Summary Result"):
+        clear_tab_state("current_summary_email")
+        st.rerun()
 
 
 def render_smart_reply_tab(gmail_manager, email_ai):
     """Render the smart reply tab"""
     st.header("Smart Reply Generator")
     
-    found = False
-    for key in st.session_state.keys():
-        if key.startswith("email_to_reply_"):
-            found = True
-            email = st.session_state[key]
-            st.subheader(f"Reply to: {email['subject']}")
-            
-            # Reply tone selection
-            tone = st.selectbox("Select reply tone:", REPLY_TONES)
+    email = st.session_state.get("current_reply_email")
+    if email is None:
+        st.info("Select an email from the Email List tab to generate a reply.")
+        return
+    
+    st.subheader(f"Reply to: {email['subject']}")
+    
+    # Reply tone selection
+    tone = st.selectbox("Select reply tone:", REPLY_TONES)
+    
+    if st.button("Generate Reply"):
+        st.write("**Generated Reply:**")
+        reply = st.write_stream(email_ai.generate_smart_reply_stream(email, tone))
+        st.text_area("Reply content:", reply, height=200)
+        
+        # Option to send reply
+        if st.button("📤 Send Reply"):
+            sender_email = gmail_manager.extract_sender_email(email['sender'])
             
-            if st.button("Generate Reply"):
-                with st.spinner("Generating smart reply with Gemini..."):
-                    reply = email_ai.generate_smart_reply(email, tone)
-                
-                st.write("**Generated Reply:**")
-                st.text_area("Reply content:", reply, height=200)
-                
-                # Option to send reply
-                if st.button("📤 Send Reply"):
-                    sender_email = gmail_manager.extract_sender_email(email['sender'])
-                    
-                    result = gmail_manager.send_reply(
-                        email['thread_id'],
-                        sender_email,
-                        email['subject'],
-                        reply
-                    )
-                    
-                    if result:
-                        st.success("Reply sent successfully!")
-                    else:
-                        st.error("Failed to send reply.")
+            result = gmail_manager.send_reply(
+                email['thread_id'],
+                sender_email,
+                email['subject'],
+                reply
+            )
             
-            if st.button("Clear Reply Result"):
-                clear_tab_state("email_to_reply_")
-                st.rerun()
-            break
+            if result:
+                st.success("Reply sent successfully!")
+            else:
+                st.error("Failed to send reply.")
     
-    if not found:
-        st.info("Select an email from the Email List tab to generate a reply.")
+    if st.button("Clear Reply Result"):
+        clear_tab_state("current_reply_email")
+        st.rerun()
 
 
 def render_analytics_tab(gmail_manager, email_ai):
@@ -537,53 +524,44 @@ def render_analytics_tab(gmail_manager, email_ai):
     st.header("Email Analytics")
     
     # Check for specific email categorization first
-    found_categorization = False
-    for key in st.session_state.keys():
-        if key.startswith("email_to_categorize_"):
-            found_categorization = True
-            email = st.session_state[key]
-            st.subheader(f"Category for: {email['subject']}")
-            
-            with st.spinner("Categorizing email with Gemini..."):
-                category = email_ai.categorize_email(email)
-            
-            st.write("**AI Category:**")
-            st.write(category)
-            
-            if st.button("Clear Categorization Result"):
-                clear_tab_state("email_to_categorize_")
-                st.rerun()
-            break
-    
-    if not found_categorization:
+    email = st.session_state.get("current_category_email")
+    if email is not None:
+        st.subheader(f"Category for: {email['subject']}")
+        
+        with st.spinner("Categorizing email with Gemini..."):
+            category = email_ai.categorize_email(email)
+        
+        st.write("**AI Category:**")
+        st.write(category)
+        
+        if st.button("Clear Categorization Result"):
+            clear_tab_state("current_category_email")
+            st.rerun()
+    else:
         st.info("Select an email from the Email List tab to categorize, or analyze recent emails below.")
         
         if st.button("📊 Analyze Recent Emails"):
+            # pandas is only needed for these charts, so it is imported on first use
+            import pandas as pd
+            
             with st.spinner("Analyzing emails with Gemini..."):
                 messages = gmail_manager.get_messages(max_results=30)
                 
                 if messages:
-                    categories = []
-                    senders = []
+                    contents = fetch_email_contents(gmail_manager, messages)
                     
-                    for msg in messages:
-                        email_details = gmail_manager.get_message_details(msg['id'])
-                        if email_details:
-                            content = gmail_manager.extract_email_content(email_details)
-                            
-                            # Categorize email
-                            category = email_ai.categorize_email(content)
-                            categories.append(category)
-                            senders.append(content['sender'])
+                    # Categorize emails with a few batched AI requests
+                    categories = email_ai.categorize_emails_batch(contents)
+                    senders = [content['sender'] for content in contents]
                     
                     # Create analytics
                     st.subheader("Email Categories")
-                    category_counts = {}
+                    category_counts = Counter()
                     for cat in categories:
                         # Extract category from AI response
-                        if "Category:" in cat:
-                            category = cat.split("Category:")[1].split("\n")[0].strip()
-                            category_counts[category] = category_counts.get(category, 0) + 1
+                        m = _CATEGORY_RE.search(cat)
+                        if m:
+                            category_counts.update([m.group(1).strip()])
                     
                     if category_counts:
                         df_categories = pd.DataFrame(list(category_counts.items()), 
@@ -591,14 +569,10 @@ def render_analytics_tab(gmail_manager, email_ai):
                         st.bar_chart(df_categories.set_index('Category'))
                     
                     st.subheader("Top Senders")
-                    sender_counts = {}
-                    for sender in senders:
-                        # Extract email from sender
-                        sender_email = gmail_manager.extract_sender_email(sender)
-                        sender_counts[sender_email] = sender_counts.get(sender_email, 0) + 1
+                    sender_counts = Counter(gmail_manager.extract_sender_email(sender) for sender in senders)
                     
                     # Show top 10 senders
-                    top_senders = sorted(sender_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+                    top_senders = sender_counts.most_common(10)
                     df_senders = pd.DataFrame(top_senders, columns=['Sender', 'Count'])
                     st.dataframe(df_senders)
 
@@ -607,26 +581,19 @@ def render_sentiment_tab(email_ai):
     """Render the sentiment analysis tab"""
     st.header("Sentiment Analysis")
     
-    found = False
-    for key in st.session_state.keys():
-        if key.startswith("email_to_analyze_"):
-            found = True
-            email = st.session_state[key]
-            st.subheader(f"Sentiment Analysis for: {email['subject']}")
-            
-            with st.spinner("Analyzing sentiment with Gemini..."):
-                sentiment = email_ai.analyze_sentiment(email)
-            
-            st.write("**Sentiment Analysis:**")
-            st.write(sentiment)
-            
-            if st.button("Clear Sentiment Result"):
-                clear_tab_state("email_to_analyze_")
-                st.rerun()
-            break
-    
-    if not found:
+    email = st.session_state.get("current_sentiment_email")
+    if email is None:
         st.info("Select an email from the Email List tab to analyze sentiment.")
+        return
+    
+    st.subheader(f"Sentiment Analysis for: {email['subject']}")
+    
+    st.write("**Sentiment Analysis:**")
+    st.write_stream(email_ai.analyze_sentiment_stream(email))
+    
+    if st.button("Clear Sentiment Result"):
+        clear_tab_state("current_sentiment_email")
+        st.rerun()
 
 
 def render_chatbot_tab(gmail_manager, rag_chatbot):
@@ -651,23 +618,32 @@ def render_chatbot_tab(gmail_manager, rag_chatbot):
         
         if messages:
             st.write(f"Found {len(messages)} recent emails")
+            # Only headers are needed to label the options; bodies are fetched on load
+            headers = gmail_manager.get_headers_batch([msg['id'] for msg in messages])
             
-            # Email selection interface
-            selected_indices = st.multiselect(
-                "Choose emails to include in chat context:",
-                options=range(len(messages)),
-                format_func=lambda x: f"{messages[x]['id'][:8]}...",
-                help="Select emails to provide context for the chatbot"
-            )
+            def email_label(idx):
+                content = headers.get(messages[idx]['id'])
+                if content:
+                    return f"{content['subject']} - {content['sender']}"
+                return f"{messages[idx]['id'][:8]}..."
+            
+            # Email selection interface; a form so picking emails doesn't rerun the page
+            with st.form("chat_email_selection"):
+                selected_indices = st.multiselect(
+                    "Choose emails to include in chat context:",
+                    options=range(len(messages)),
+                    format_func=email_label,
+                    help="Select emails to provide context for the chatbot"
+                )
+                load_selected = st.form_submit_button("🔄 Load Selected Emails")
             
             # Load selected emails
-            if st.button("🔄 Load Selected Emails"):
-                st.session_state.selected_emails_for_chat = []
-                for idx in selected_indices:
-                    email_details = gmail_manager.get_message_details(messages[idx]['id'])
-                    if email_details:
-                        content = gmail_manager.extract_email_content(email_details)
-                        st.session_state.selected_emails_for_chat.append(content)
+            if load_selected:
+                st.session_state.selected_emails_for_chat = fetch_email_contents(
+                    gmail_manager, [messages[idx] for idx in selected_indices])
+                # Embed the whole selection in one batch now rather than on the first question
+                with st.spinner("Indexing emails..."):
+                    rag_chatbot.build_faiss_index(st.session_state.selected_emails_for_chat)
                 st.success(f"Loaded {len(st.session_state.selected_emails_for_chat)} emails!")
             
             # Show currently loaded emails
@@ -690,8 +666,7 @@ def render_chatbot_tab(gmail_manager, rag_chatbot):
         if st.session_state.chat_history:
             for i, (question, answer) in enumerate(st.session_state.chat_history):
                 with st.expander(f"Q: {question[:50]}...", expanded=True):
-                    st.write(f"**Question:** {question}")
-                    st.write(f"**Answer:** {answer}")
+                    st.markdown(f"**Question:** {question}\n\n**Answer:** {answer}")
                     if st.button(f"🗑️ Delete", key=f"del_{i}"):
                         st.session_state.chat_history.pop(i)
                         st.rerun()
@@ -718,8 +693,8 @@ def render_chatbot_tab(gmail_manager, rag_chatbot):
             if not st.session_state.selected_emails_for_chat:
                 st.error("Please select some emails first in the sidebar!")
             else:
-                with st.spinner("Analyzing your emails..."):
-                    answer = rag_chatbot.answer_question(user_question, st.session_state.selected_emails_for_chat)
+                answer = st.write_stream(
+                    rag_chatbot.answer_question_stream(user_question, st.session_state.selected_emails_for_chat))
                 
                 # Add to chat history
                 st.session_state.chat_history.append((user_question, answer))
@@ -764,22 +739,27 @@ def render_chatbot_tab(gmail_manager, rag_chatbot):
 
 
 
+# Footer content, built once at import; the rule and text go out as one element
+_FOOTER_MD = """
+---
+
+**Gmail AI Assistant** - Built with Streamlit and Google Gemini 2.0 Flash
+
+**Features:**
+- 📧 Email listing and management
+- 🔍 Smart search with natural language
+- 📝 AI-powered email summaries
+- 💬 Smart reply generation with multiple tones
+- 🏷️ Automatic email categorization
+- 📊 Email analytics and insights
+- ⚡ Action item extraction
+- 🎭 Sentiment analysis
+- 🤖 RAG Chatbot for email queries
+
+**Powered by Google Gemini 2.0 Flash** for advanced AI capabilities
+"""
+
+
 def render_footer():
     """Render the footer"""
-    st.markdown("---")
-    st.markdown("""
-    **Gmail AI Assistant** - Built with Streamlit and Google Gemini 2.0 Flash
-    
-    **Features:**
-    - 📧 Email listing and management
-    - 🔍 Smart search with natural language
-    - 📝 AI-powered email summaries
-    - 💬 Smart reply generation with multiple tones
-    - 🏷️ Automatic email categorization
-    - 📊 Email analytics and insights
-    - ⚡ Action item extraction
-    - 🎭 Sentiment analysis
-    - 🤖 RAG Chatbot for email queries
-    
-    **Powered by Google Gemini 2.0 Flash** for advanced AI capabilities
-    """) 
\ No newline at end of file
+    st.markdown(_FOOTER_MD) 
\ No newline at end of file
@@ -2,16 +2,135 @@
 Utility functions for handling SSL and network issues
 """
 
+import asyncio
 import ssl
 import socket
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Optional
+import certifi
+import httpx
 import urllib3
-import requests
 from urllib3.util.ssl_ import create_urllib3_context
 import streamlit as st
 
+# Hosts whose DNS answers are cached in-process, how long for, and how many lookups to keep
+_DNS_CACHE_HOSTS = frozenset({'www.google.com', 'gmail.googleapis.com'})
+_DNS_TTL = 300
+_DNS_CACHE_SIZE = 128
+
+_orig_getaddrinfo = socket.getaddrinfo
+_dns_cache = OrderedDict()
+_dns_lock = threading.Lock()
+
+
+def _cached_getaddrinfo(host, port, *args, **kwargs):
+    """socket.getaddrinfo that remembers answers for the probed Google hosts"""
+    if host not in _DNS_CACHE_HOSTS:
+        return _orig_getaddrinfo(host, port, *args, **kwargs)
+    key = (host, port, args, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+    with _dns_lock:
+        entry = _dns_cache.get(key)
+        if entry and entry[0] > now:
+            _dns_cache.move_to_end(key)
+            return entry[1]
+    result = _orig_getaddrinfo(host, port, *args, **kwargs)
+    with _dns_lock:
+        _dns_cache[key] = (now + _DNS_TTL, result)
+        _dns_cache.move_to_end(key)
+        while len(_dns_cache) > _DNS_CACHE_SIZE:
+            _dns_cache.popitem(last=False)
+    return result
+
+
+socket.getaddrinfo = _cached_getaddrinfo
+
+# One SSL context for every probe connection, so the CA bundle and cipher list
+# are loaded once at import rather than per connection
+_PRELOADED_CTX = ssl.create_default_context(cafile=certifi.where())
+_PRELOADED_CTX.minimum_version = ssl.TLSVersion.TLSv1_2
 
+
+# HTTP/2 needs the optional h2 package (installed by httpx[http2])
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# Probe endpoints; google.com only needs to accept a TCP connection, and 401/403
+# means the Gmail API is reachable but needs auth
+_INTERNET_HOST = 'www.google.com'
+_GMAIL_API_URL = 'https://gmail.googleapis.com/gmail/v1/users/me/profile'
+_GMAIL_API_OK = (200, 401, 403)
+
+
+@dataclass(frozen=True)
+class ProbeResult:
+    """Outcome of a connectivity probe; error explains a failure"""
+    ok: bool
+    error: Optional[str] = None
+
+
+# Short connect/read timeouts, and retries with exponential backoff for failed
+# connections and gateway errors, so one lost packet doesn't fail the probe
+_PROBE_TIMEOUT = httpx.Timeout(5.0, connect=2.0)
+_PROBE_RETRIES = 2
+_RETRY_STATUSES = frozenset({502, 503, 504})
+_RETRY_BACKOFF = 0.3
+
+
+def _probe_client():
+    """Create an async client for probing; its connections belong to the running event loop"""
+    transport = httpx.AsyncHTTPTransport(http2=_HTTP2, verify=_PRELOADED_CTX, retries=_PROBE_RETRIES)
+    return httpx.AsyncClient(transport=transport, timeout=_PROBE_TIMEOUT)
+
+
+async def _head_status(client, url):
+    """HEAD a URL and return the status code, without downloading a body"""
+    for attempt in range(_PROBE_RETRIES + 1):
+        response = await client.head(url)
+        if response.status_code not in _RETRY_STATUSES or attempt == _PROBE_RETRIES:
+            return response.status_code
+        await asyncio.sleep(_RETRY_BACKOFF * 2 ** attempt)
+
+
+async def _tcp_connect(host, port=443):
+    """Open and close a TCP connection; proves DNS and routing work without paying for a TLS handshake"""
+    _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), _PROBE_TIMEOUT.connect)
+    writer.close()
+    await writer.wait_closed()
+    return True
+
+
+def _to_result(outcome, ok_statuses=(True,)):
+    """Turn a probe's outcome (status code or True), or the exception it raised, into a ProbeResult"""
+    if isinstance(outcome, BaseException):
+        return ProbeResult(False, str(outcome) or type(outcome).__name__)
+    if outcome in ok_statuses:
+        return ProbeResult(True)
+    return ProbeResult(False, f"unexpected HTTP status {outcome}")
+
+
+async def probe_all():
+    """Check internet reachability with a TCP connect and the Gmail API over HTTPS at once, returning their ProbeResults"""
+    async with _probe_client() as client:
+        internet, gmail = await asyncio.gather(
+            _tcp_connect(_INTERNET_HOST),
+            _head_status(client, _GMAIL_API_URL),
+            return_exceptions=True,
+        )
+    return _to_result(internet), _to_result(gmail, _GMAIL_API_OK)
+
+
+@lru_cache(maxsize=1)
 def configure_ssl_context():
-    """Configure SSL context to handle various SSL issues"""
+    """Configure SSL context to handle various SSL issues; built once and shared"""
     try:
         # Create a custom SSL context
         ssl_context = ssl.create_default_context()
@@ -32,84 +151,106 @@ def configure_ssl_context():
         return None
 
 
-def test_network_connectivity():
-    """Test basic network connectivity"""
+@st.cache_data(ttl=60, show_spinner=False)
+def _cached_probes():
+    """Run the internet and Gmail API probes concurrently, reusing the ProbeResults for a minute"""
+    return asyncio.run(probe_all())
+
+
+def run_probes():
+    """Run the internet and Gmail API probes; only all-passing results are reused for a minute"""
+    results = _cached_probes()
+    if not all(result.ok for result in results):
+        # Drop failures right away so testing again after a transient error probes afresh
+        _cached_probes.clear()
+    return results
+
+
+def _collect_network_info():
+    """Gather network information for debugging"""
     try:
-        # Test basic internet connectivity
-        response = requests.get('https://www.google.com', timeout=10)
-        return response.status_code == 200
+        info = {
+            'hostname': socket.gethostname(),
+            'ssl_version': ssl.OPENSSL_VERSION,
+            'python_ssl_version': ssl.version_info,
+        }
     except Exception as e:
-        st.error(f"Network connectivity test failed: {str(e)}")
-        return False
+        info = {'error': str(e)}
+    return MappingProxyType(info)
 
 
-def check_gmail_api_access():
-    """Check if Gmail API is accessible"""
-    try:
-        # Test Gmail API endpoint
-        response = requests.get('https://gmail.googleapis.com/gmail/v1/users/me/profile', timeout=10)
-        return response.status_code in [200, 401, 403]  # 401/403 means API is reachable but needs auth
-    except Exception as e:
-        st.error(f"Gmail API access test failed: {str(e)}")
-        return False
+# None of this changes while the process runs, so it is collected once at import
+_NETWORK_INFO = _collect_network_info()
 
 
 def get_network_info():
     """Get network information for debugging"""
-    try:
-        info = {
-            'hostname': socket.gethostname(),
-            'ssl_version': ssl.OPENSSL_VERSION,
-            'python_ssl_version': ssl.version_info,
-        }
-        return info
-    except Exception as e:
-        return {'error': str(e)}
+    return _NETWORK_INFO
+
+
+# Prebuilt (read-only) explanations for known SSL errors
+_SSL_VERSION_ERROR = MappingProxyType({
+    'type': 'SSL_VERSION_ERROR',
+    'message': 'SSL/TLS version mismatch. This usually happens when connecting to a non-SSL port with SSL.',
+    'solutions': (
+        'Check if you\'re using the correct port (443 for HTTPS)',
+        'Verify your network proxy settings',
+        'Try disabling any VPN or firewall temporarily',
+        'Update your Python SSL libraries'
+    )
+})
+
+_SSL_CERT_ERROR = MappingProxyType({
+    'type': 'SSL_CERT_ERROR',
+    'message': 'SSL certificate verification failed.',
+    'solutions': (
+        'Update your system\'s CA certificates',
+        'Check your system clock (certificates depend on correct time)',
+        'Try updating Python and pip packages'
+    )
+})
+
+_CONNECTION_REFUSED = MappingProxyType({
+    'type': 'CONNECTION_REFUSED',
+    'message': 'Connection was refused by the server.',
+    'solutions': (
+        'Check your internet connection',
+        'Verify the API endpoint is correct',
+        'Try again in a few minutes (server might be temporarily unavailable)'
+    )
+})
+
+# ssl.SSLError reasons, looked up directly before falling back to scanning the message
+_REASON_MAP = {
+    'WRONG_VERSION_NUMBER': _SSL_VERSION_ERROR,
+    'CERTIFICATE_VERIFY_FAILED': _SSL_CERT_ERROR,
+}
+
+# Markers searched for in other errors' messages, checked in order
+_SSL_ERROR_TABLE = (
+    ('wrong_version_number', _SSL_VERSION_ERROR),
+    ('certificate_verify_failed', _SSL_CERT_ERROR),
+    ('connection_refused', _CONNECTION_REFUSED),
+)
+
+_UNKNOWN_SSL_ERROR = MappingProxyType({
+    'type': 'UNKNOWN_SSL_ERROR',
+    'solutions': (
+        'Check your internet connection',
+        'Try restarting the application',
+        'Update your Python packages',
+        'Check for firewall or proxy issues'
+    )
+})
 
 
 def handle_ssl_error(error):
     """Handle SSL errors with specific solutions"""
+    info = _REASON_MAP.get(getattr(error, 'reason', None))
+    if info is not None:
+        return info
     error_str = str(error).lower()
-    
-    if 'wrong_version_number' in error_str:
-        return {
-            'type': 'SSL_VERSION_ERROR',
-            'message': 'SSL/TLS version mismatch. This usually happens when connecting to a non-SSL port with SSL.',
-            'solutions': [
-                'Check if you\'re using the correct port (443 for HTTPS)',
-                'Verify your network proxy settings',
-                'Try disabling any VPN or firewall temporarily',
-                'Update your Python SSL libraries'
-            ]
-        }
-    elif 'certificate_verify_failed' in error_str:
-        return {
-            'type': 'SSL_CERT_ERROR',
-            'message': 'SSL certificate verification failed.',
-            'solutions': [
-                'Update your system\'s CA certificates',
-                'Check your system clock (certificates depend on correct time)',
-                'Try updating Python and pip packages'
-            ]
-        }
-    elif 'connection_refused' in error_str:
-        return {
-            'type': 'CONNECTION_REFUSED',
-            'message': 'Connection was refused by the server.',
-            'solutions': [
-                'Check your internet connection',
-                'Verify the API endpoint is correct',
-                'Try again in a few minutes (server might be temporarily unavailable)'
-            ]
-        }
-    else:
-        return {
-            'type': 'UNKNOWN_SSL_ERROR',
-            'message': f'Unknown SSL error: {error}',
-            'solutions': [
-                'Check your internet connection',
-                'Try restarting the application',
-                'Update your Python packages',
-                'Check for firewall or proxy issues'
-            ]
-        } 
\ No newline at end of file
+    for marker, info in _SSL_ERROR_TABLE:
+        if marker in error_str:
+            return info
+    return {**_UNKNOWN_SSL_ERROR, 'message': f'Unknown SSL error: {error}'} 
\ No newline at end of file